@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 import os
 import json
 from main import logger
+from render_rpc import RenderRpcClient
+from tracing import tracer, trace_headers
+from opentelemetry.trace import SpanKind
 
 load_dotenv()
 
@@ -24,10 +27,24 @@ GOOGLE_CREDENTIALS = json.loads(GOOGLE_CREDENTIALS)
 async def sleep_backoff(attempt: int):
     await asyncio.sleep(min(60, (2 ** attempt)))
 
-async def fetch_rendered_template(code: str, variable: dict) -> str:
+# one pooled client so renders reuse keep-alive connections to the template service
+_http_client: httpx.AsyncClient | None = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=10)
+    return _http_client
+
+async def fetch_rendered_template(code: str, variable: dict, rpc: RenderRpcClient | None = None) -> str:
     logger.info(f"fetched rendered template {code} variables: {json.dumps(variable)}")
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(f'{TEMPLATE_URL}/render/{code}')
+    with tracer.start_as_current_span('template.render', kind=SpanKind.CLIENT) as span:
+        span.set_attribute('template.code', code)
+        span.set_attribute('template.transport', 'http' if rpc is None else 'rpc')
+        if rpc is not None:
+            return await rpc.render(code, variable, headers=trace_headers())
+        r = await get_http_client().post(f'{TEMPLATE_URL}/render/{code}', json=variable, headers=trace_headers())
+        span.set_attribute('http.response.status_code', r.status_code)
         r.raise_for_status()
         return r.json().get('rendered')
     
@@ -35,6 +52,8 @@ async def send_fcm(token: str, title: str, body: str, data: dict | None = None):
     logger.info(f"Attempted to send message with details {title} {body} {json.dumps(data)} {token}")
     push_service = FCMNotification(credentials=credentials.Credentials(GOOGLE_CREDENTIALS))
     loop = asyncio.get_event_loop()
-    result = await loop.run_in_executor(None, lambda: push_service.notify(fcm_token=token ,notification_body=body, notification_title=title, data_payload=data or {}))
+    with tracer.start_as_current_span('fcm.send', kind=SpanKind.CLIENT) as span:
+        result = await loop.run_in_executor(None, lambda: push_service.notify(fcm_token=token ,notification_body=body, notification_title=title, data_payload=data or {}))
+        span.set_attribute('fcm.failure', bool(result.get('failure')))
     return result
 
@@ -4,7 +4,11 @@ import aio_pika
 import os
 import json
 from redis import asyncio as aioredis
-from lib import sleep_backoff, send_fcm, fetch_rendered_template
+from lib import sleep_backoff, send_fcm, fetch_rendered_template, get_http_client
+from render_rpc import RenderRpcClient
+import codec
+from tracing import setup_tracing, context_from, trace_headers, tracer
+from opentelemetry.trace import SpanKind, Status, StatusCode
 from dotenv import load_dotenv
 import sys
 
@@ -37,6 +41,9 @@ TEMPLATE_SERVICE_URL = os.getenv('TEMPLATE_SERVICE_URL')
 
 REDIS_URL = os.getenv('REDIS_URL')
 
+# 'http' (default) or 'rpc' for the msgpack render queue served by the template service
+TEMPLATE_RENDER_TRANSPORT = os.getenv('TEMPLATE_RENDER_TRANSPORT', 'http')
+
 if not TEMPLATE_SERVICE_URL:
     raise Exception('Template service url not found')
 
@@ -51,10 +58,16 @@ app = FastAPI(title='Push Service')
 
 @app.on_event('startup')
 async def startup():
+    app.state.tracer_provider = setup_tracing()
     app.state.redis = await aioredis.from_url(REDIS_URL)
     app.state.rabbit_conn = await aio_pika.connect_robust(RABBIT_URL)
     app.state.channel = await app.state.rabbit_conn.channel()
     await app.state.channel.set_qos(prefetch_count=10)
+    app.state.render_rpc = None
+    if TEMPLATE_RENDER_TRANSPORT == 'rpc':
+        # separate channel so the consumer's qos does not throttle rpc replies
+        app.state.render_rpc = RenderRpcClient(await app.state.rabbit_conn.channel())
+        await app.state.render_rpc.start()
     queue = await app.state.channel.declare_queue('push.queue', durable=True)
     await queue.consume(on_message)
 
@@ -63,6 +76,9 @@ async def startup():
 async def shutdown():
     await app.state.rabbit_conn.close()
     await app.state.redis.close()
+    await get_http_client().aclose()
+    if app.state.tracer_provider is not None:
+        app.state.tracer_provider.shutdown()
 
 
 @app.get('/health')
@@ -74,32 +90,61 @@ async def health():
 @app.post('/send/')
 async def send_push(payload: PushMessage):
     # For quick testing: publish to rabbitmq
-    logger.info(f"Raw json payload: {json.dumps(payload, indent=2)}")
+    logger.info(f"Raw json payload: {json.dumps(payload.dict(), indent=2)}")
 
     conn = await aio_pika.connect_robust(RABBIT_URL)
     channel = await conn.channel()
-    await channel.default_exchange.publish(
-        aio_pika.Message(body=json.dumps(payload.dict()).encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
-        routing_key='push.queue'
-    )
+    body, content_type, content_encoding = codec.encode(payload.dict())
+    with tracer.start_as_current_span('push.queue publish', kind=SpanKind.PRODUCER):
+        await channel.default_exchange.publish(
+            aio_pika.Message(body=body, content_type=content_type, content_encoding=content_encoding,
+                             delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                             headers=trace_headers(), timestamp=datetime.now(timezone.utc)),
+            routing_key='push.queue'
+        )
     await conn.close()
     return {"success": True, "message": "queued"}
 
 # Idempotency key helper
 async def is_processed(request_id: str) -> bool:
     logging.info(f"Checked if {request_id} was processed")
-    return await app.state.redis.get(f"processed:{request_id}") is not None
+    with tracer.start_as_current_span('idempotency.check') as span:
+        processed = await app.state.redis.get(f"processed:{request_id}") is not None
+        span.set_attribute('push.already_processed', processed)
+    return processed
 
 async def mark_processed(request_id: str, ttl: int = 60*60*24):
     logging.info(f"marked {request_id} as processed")
     await app.state.redis.set(f"processed:{request_id}", "1", ex=ttl)
 
+def dead_letter(message: aio_pika.abc.AbstractIncomingMessage) -> aio_pika.Message:
+    # same body and format properties, so failed.queue consumers can decode either format
+    return aio_pika.Message(
+        body=message.body,
+        content_type=message.content_type,
+        content_encoding=message.content_encoding,
+        headers=message.headers,
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+    )
+
+
 async def on_message(message: aio_pika.abc.AbstractIncomingMessage):
-    logging.info(f"called on_message on {json.dumps(message)}")
+    logging.info(f"called on_message on {message.message_id or message.delivery_tag}")
+    with tracer.start_as_current_span('push.queue process', context=context_from(message.headers), kind=SpanKind.CONSUMER) as span:
+        if message.timestamp:
+            # time spent waiting in push.queue since the publisher stamped the message
+            queued_for = datetime.now(timezone.utc) - message.timestamp.replace(tzinfo=message.timestamp.tzinfo or timezone.utc)
+            span.set_attribute('messaging.queue_wait_ms', round(queued_for.total_seconds() * 1000, 1))
+        await process_message(message, span)
+
+
+async def process_message(message: aio_pika.abc.AbstractIncomingMessage, span):
     async with message.process(requeue=False):
         try:
-            payload = json.loads(message.body)
+            payload = codec.decode(message.body, message.content_type, message.content_encoding)
             request_id = payload.get('request_id')
+            span.set_attribute('push.request_id', str(request_id))
+            span.set_attribute('template.code', str(payload.get('template_code')))
             # idempotency check
             if await is_processed(request_id):
                 return
@@ -116,15 +161,16 @@ async def on_message(message: aio_pika.abc.AbstractIncomingMessage):
             max_attempts = 5
             while attempt < max_attempts:
                 try:
-                    rendered = await fetch_rendered_template(payload['template_code'], payload.get('variables', {}))
+                    rendered = await fetch_rendered_template(payload['template_code'], payload.get('variables', {}), rpc=app.state.render_rpc)
                     break
                 except Exception as e:
                     attempt += 1
                     await sleep_backoff(attempt)
             else:
+                span.set_status(Status(StatusCode.ERROR, 'template render failed'))
                 # move to dead-letter queue
                 await app.state.channel.default_exchange.publish(
-                    aio_pika.Message(body=message.body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                    dead_letter(message),
                     routing_key='failed.queue'
                 )
                 return
@@ -147,8 +193,8 @@ async def on_message(message: aio_pika.abc.AbstractIncomingMessage):
                         aio_pika.Message(body=json.dumps({
                             'notification_id': request_id,
                             'status': 'delivered',
-                            'timestamp': datetime.now(timezone.utc)
-                        }).encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                            'timestamp': datetime.now(timezone.utc).isoformat()
+                        }).encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT, headers=trace_headers()),
                         routing_key='notification.status'
                     )
                     break
@@ -156,9 +202,10 @@ async def on_message(message: aio_pika.abc.AbstractIncomingMessage):
                     attempt += 1
                     await sleep_backoff(attempt)
             else:
+                span.set_status(Status(StatusCode.ERROR, 'fcm send failed'))
                 # permanent failure
                 await app.state.channel.default_exchange.publish(
-                    aio_pika.Message(body=message.body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                    dead_letter(message),
                     routing_key='failed.queue'
                 )
                 # publish failed status
@@ -166,15 +213,17 @@ async def on_message(message: aio_pika.abc.AbstractIncomingMessage):
                     aio_pika.Message(body=json.dumps({
                         'notification_id': request_id,
                         'status': 'failed',
-                        'timestamp': datetime.now(timezone.utc),
+                        'timestamp': datetime.now(timezone.utc).isoformat(),
                         'error': 'fcm send failed'
-                    }).encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                    }).encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT, headers=trace_headers()),
                     routing_key='notification.status'
                 )
         except Exception as exc:
+            span.record_exception(exc)
+            span.set_status(Status(StatusCode.ERROR, str(exc)))
             # ensure message doesn't get lost — move to failed queue
             await app.state.channel.default_exchange.publish(
-                aio_pika.Message(body=message.body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                dead_letter(message),
                 routing_key='failed.queue'
             )
             print('error processing message', exc)
@@ -0,0 +1,61 @@
+import asyncio
+import uuid
+
+import aio_pika
+import msgpack
+
+
+class RenderError(Exception):
+    def __init__(self, status: int, detail):
+        super().__init__(f"render failed with {status}: {detail}")
+        self.status = status
+        self.detail = detail
+
+
+class RenderRpcClient:
+    """Client for template-service's render RPC queue.
+
+    Requests share one channel and one callback queue, so many renders can be
+    in flight at once; replies are matched back by correlation id.
+    """
+
+    def __init__(self, channel: aio_pika.abc.AbstractChannel, queue_name: str = 'template.render', timeout: float = 10):
+        self.channel = channel
+        self.queue_name = queue_name
+        self.timeout = timeout
+        self.callback_queue: aio_pika.abc.AbstractQueue | None = None
+        self.futures: dict[str, asyncio.Future] = {}
+
+    async def start(self):
+        self.callback_queue = await self.channel.declare_queue(exclusive=True, auto_delete=True)
+        await self.callback_queue.consume(self.on_response, no_ack=True)
+
+    async def on_response(self, message: aio_pika.abc.AbstractIncomingMessage):
+        future = self.futures.pop(message.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_result(msgpack.unpackb(message.body))
+
+    async def render(self, code: str, variables: dict | None = None, headers: dict | None = None) -> str:
+        correlation_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.futures[correlation_id] = future
+        try:
+            await self.channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=msgpack.packb({'code': code, 'variables': variables or {}}),
+                    content_type='application/msgpack',
+                    correlation_id=correlation_id,
+                    reply_to=self.callback_queue.name,
+                    # stale requests are dropped by the broker instead of rendered for nobody
+                    expiration=self.timeout,
+                    headers=headers or {},
+                ),
+                routing_key=self.queue_name,
+            )
+            response = await asyncio.wait_for(future, timeout=self.timeout)
+        finally:
+            self.futures.pop(correlation_id, None)
+
+        if 'error' in response:
+            raise RenderError(response['error'].get('status'), response['error'].get('detail'))
+        return response['rendered']
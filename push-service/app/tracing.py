@@ -0,0 +1,63 @@
+"""OpenTelemetry tracing for the push pipeline.
+
+Trace context travels as W3C ``traceparent``/``tracestate``: read from the
+AMQP headers of push.queue messages, and written into the HTTP or RPC render
+request and the status messages this service publishes. Sampling is
+parent-based, so a trace the gateway started is followed end to end and new
+traces are kept at TRACE_SAMPLE_RATIO.
+"""
+import os
+
+from opentelemetry import trace
+from opentelemetry.propagate import extract, inject
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+# 'none', 'file' (JSON lines at TRACE_FILE) or 'otlp' (collector at TRACE_OTLP_ENDPOINT)
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none')
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_SAMPLE_RATIO = float(os.getenv('TRACE_SAMPLE_RATIO', '0.05'))
+
+tracer = trace.get_tracer('push-service')
+
+
+def make_exporter():
+    if TRACE_EXPORTER == 'file':
+        out = open(TRACE_FILE, 'a', buffering=1)
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep)
+    if TRACE_EXPORTER == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=TRACE_OTLP_ENDPOINT)
+    return None
+
+
+def setup_tracing() -> TracerProvider | None:
+    exporter = make_exporter()
+    if exporter is None:
+        return None
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': 'push-service'}),
+        sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def context_from(headers: dict | None):
+    # AMQP header values may arrive as bytes
+    carrier = {
+        str(key).lower(): value.decode() if isinstance(value, bytes) else str(value)
+        for key, value in (headers or {}).items()
+    }
+    return extract(carrier)
+
+
+def trace_headers() -> dict:
+    """Headers carrying the current span, for an outgoing HTTP request or AMQP message."""
+    headers: dict = {}
+    inject(headers)
+    return headers
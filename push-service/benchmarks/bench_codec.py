@@ -0,0 +1,120 @@
+"""push.queue message format benchmark: JSON vs msgpack, with and without deflate.
+
+Only needs msgpack; no broker is involved:
+
+    python benchmarks/bench_codec.py
+    python benchmarks/bench_codec.py --output results.json
+
+For each payload size and format it reports bytes per message and the
+encode/decode time per message, plus the change against plain JSON.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+import codec
+
+FORMATS = {
+    'json': (codec.JSON, 0),
+    'json+deflate': (codec.JSON, 1),
+    'msgpack': (codec.MSGPACK, 0),
+    'msgpack+deflate': (codec.MSGPACK, 1),
+}
+
+
+def build_payload(variable_count: int, text_length: int) -> dict:
+    # the shape the gateway publishes: nested variables plus delivery metadata
+    return {
+        'request_id': 'req-7f3c2a9e-5d41-4b8e-9c1a-2f6e8d0b4a17',
+        'user_id': '0b8f9e2a-6c3d-4f1e-8a7b-5d2c9e4f1a3b',
+        'template_code': 'order_shipped',
+        'variables': {
+            **{f'var_{i}': f'value {i} ' + 'x' * text_length for i in range(variable_count)},
+            'items': [{'name': f'item-{i}', 'qty': i, 'price': i * 1.25} for i in range(variable_count)],
+        },
+        'priority': 5,
+        'metadata': {
+            'push_token': 'fcm-' + 'a' * 152,
+            'title': 'Your order has shipped',
+            'campaign': 'autumn-sale',
+            'locale': 'en-GB',
+        },
+    }
+
+
+def time_per_op_us(fn, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - started)
+    samples.sort()
+    return {
+        'mean_us': round(statistics.fmean(samples) / 1000, 2),
+        'p99_us': round(samples[max(0, int(len(samples) * 0.99) - 1)] / 1000, 2),
+    }
+
+
+def run(payloads: dict[str, dict], iterations: int) -> list[dict]:
+    results = []
+    for size, payload in payloads.items():
+        baseline = None
+        for name, (content_type, compress) in FORMATS.items():
+            # compress=1 deflates every body; 0 never does
+            body, ctype, encoding = codec.encode(payload, content_type, compress_min_bytes=compress)
+            assert codec.decode(body, ctype, encoding) == payload
+            encode = time_per_op_us(lambda: codec.encode(payload, content_type, compress_min_bytes=compress), iterations)
+            decode = time_per_op_us(lambda: codec.decode(body, ctype, encoding), iterations)
+            result = {
+                'payload': size,
+                'format': name,
+                'bytes': len(body),
+                'encode_us': encode['mean_us'],
+                'decode_us': decode['mean_us'],
+                'decode_p99_us': decode['p99_us'],
+            }
+            if baseline is None:
+                baseline = result
+            result['bytes_vs_json'] = f"{(result['bytes'] / baseline['bytes'] - 1) * 100:+.1f}%"
+            result['decode_vs_json'] = f"{(result['decode_us'] / baseline['decode_us'] - 1) * 100:+.1f}%"
+            results.append(result)
+    return results
+
+
+def print_table(results: list[dict]):
+    print(f"{'payload':<8} {'format':<16} {'bytes':>8} {'vs json':>9} {'encode us':>10} {'decode us':>10} {'vs json':>9}")
+    for r in results:
+        print(f"{r['payload']:<8} {r['format']:<16} {r['bytes']:>8} {r['bytes_vs_json']:>9} "
+              f"{r['encode_us']:>10} {r['decode_us']:>10} {r['decode_vs_json']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='push.queue message format benchmark')
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    payloads = {
+        'small': build_payload(variable_count=3, text_length=10),
+        'medium': build_payload(variable_count=20, text_length=40),
+        'large': build_payload(variable_count=200, text_length=80),
+    }
+    results = run(payloads, args.iterations)
+    print_table(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'results': results,
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
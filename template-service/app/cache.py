@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from redis import asyncio as aioredis
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def variables_digest(variables: dict | None) -> str:
+    # stable across key order so {"a": 1, "b": 2} and {"b": 2, "a": 1} share an entry
+    raw = json.dumps(variables or {}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def template_version(content: str) -> str:
+    # the content digest doubles as the template version, so edits never serve stale output
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+class RenderCache:
+    """In-process LRU of rendered output with an optional shared Redis tier."""
+
+    def __init__(self, max_entries: int, ttl: int, redis_url: str | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._redis = aioredis.from_url(redis_url) if redis_url else None
+        self.stats = {'hits': 0, 'redis_hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def key(code: str, content: str, variables: dict | None) -> str:
+        return f"render:{code}:{template_version(content)}:{variables_digest(variables)}"
+
+    async def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, rendered = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return rendered
+            del self._entries[key]
+
+        if self._redis is not None:
+            try:
+                cached = await self._redis.get(key)
+            except Exception as exc:
+                logger.warning(f"render cache redis get failed: {exc}")
+                cached = None
+            if cached is not None:
+                rendered = cached.decode()
+                self._store_local(key, rendered)
+                self.stats['redis_hits'] += 1
+                return rendered
+
+        self.stats['misses'] += 1
+        return None
+
+    async def set(self, key: str, rendered: str):
+        self._store_local(key, rendered)
+        if self._redis is not None:
+            try:
+                await self._redis.set(key, rendered, ex=self.ttl)
+            except Exception as exc:
+                logger.warning(f"render cache redis set failed: {exc}")
+
+    def _store_local(self, key: str, rendered: str):
+        self._entries[key] = (time.monotonic() + self.ttl, rendered)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'redis': self._redis is not None,
+        }
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+
+
+render_cache = RenderCache(
+    max_entries=settings.RENDER_CACHE_MAX_ENTRIES,
+    ttl=settings.RENDER_CACHE_TTL_SECONDS,
+    redis_url=settings.RENDER_CACHE_REDIS_URL,
+)
@@ -25,4 +25,33 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = 'Template Service'
     DATABASE_URL: str = POSTGRE_DATABASE_URL
 
+    # render output cache; only templates with cache_output=True are cached
+    RENDER_CACHE_ENABLED: bool = True
+    RENDER_CACHE_MAX_ENTRIES: int = 10_000
+    RENDER_CACHE_TTL_SECONDS: int = 300
+    RENDER_CACHE_REDIS_URL: str | None = None
+
+    # compiled templates: 'filesystem', 'redis' or 'none' for the shared bytecode tier
+    TEMPLATE_BYTECODE_CACHE: str = 'filesystem'
+    TEMPLATE_BYTECODE_CACHE_DIR: str | None = None
+    TEMPLATE_BYTECODE_CACHE_REDIS_URL: str | None = None
+    TEMPLATE_COMPILE_CACHE_SIZE: int = 1024
+    # startup warm-up; a limit of 0 compiles every stored template
+    TEMPLATE_WARMUP_ENABLED: bool = True
+    TEMPLATE_WARMUP_LIMIT: int = 0
+    # reject renders that omit variables the template declares
+    TEMPLATE_STRICT_VARIABLES: bool = True
+
+    # msgpack render RPC over RabbitMQ; disabled when no broker url is set
+    RABBITMQ_URL: str | None = None
+    RENDER_RPC_QUEUE: str = 'template.render'
+    RENDER_RPC_PREFETCH: int = 64
+
+    # tracing: 'none', 'file' (JSON lines at TRACE_FILE) or 'otlp' (collector at TRACE_OTLP_ENDPOINT)
+    TRACE_EXPORTER: str = 'none'
+    TRACE_FILE: str = 'traces.jsonl'
+    TRACE_OTLP_ENDPOINT: str = 'http://localhost:4318/v1/traces'
+    # share of new traces kept; requests inside a sampled trace are always kept
+    TRACE_SAMPLE_RATIO: float = 0.05
+
 settings = Settings()
\ No newline at end of file
@@ -3,8 +3,8 @@ from models import Template
 from sqlmodel import select
 
 
-async def create_template(session: SessionDep, code: str, content: str, language: str | None ='en'):
-    tpl = Template(code=code, content=content, language=language) # type: ignore
+async def create_template(session: SessionDep, code: str, content: str, variables: list[str], language: str | None ='en', cache_output: bool = False):
+    tpl = Template(code=code, content=content, variables=variables, language=language, cache_output=cache_output) # type: ignore
     session.add(tpl)
     session.commit()
     session.refresh(tpl)
@@ -12,4 +12,12 @@ async def create_template(session: SessionDep, code: str, content: str, language
 
 async def get_template_by_code(session: SessionDep, code: str):
     tpl = session.exec(select(Template).where(Template.code == code)).first()
-    return tpl
\ No newline at end of file
+    return tpl
+
+async def update_template(session: SessionDep, tpl: Template, **changes):
+    for field, value in changes.items():
+        setattr(tpl, field, value)
+    session.add(tpl)
+    session.commit()
+    session.refresh(tpl)
+    return tpl
@@ -1,21 +1,95 @@
-from fastapi import FastAPI, status
+from fastapi import FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 
 from deps import SessionDep
 from models import *
 from fastapi.exceptions import HTTPException
 from contextlib import asynccontextmanager
-from sqlmodel import SQLModel
+from sqlmodel import SQLModel, Session, select
+from renderer import bytecode_cache_description, compile_template, declared_variables
+from jinja2 import TemplateSyntaxError
+import asyncio
+import logging
+import time
 from core.db import engine
+from core.config import settings
+from cache import render_cache
+from render_service import render_by_code
+from rpc import RenderRpcServer
+from tracing import setup_tracing, context_from, tracer
+from opentelemetry.trace import SpanKind
 import crud
+import schema
+
+logger = logging.getLogger(__name__)
+
+warmup_state = {
+    'ready': False,
+    'templates_compiled': 0,
+    'templates_failed': 0,
+    'duration_ms': None,
+}
+
+def precompile(code: str, content: str) -> list[str]:
+    try:
+        variables = declared_variables(content)
+        compile_template(code, content)
+    except TemplateSyntaxError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": f"invalid template: {exc.message}", "line": exc.lineno},
+        )
+    return variables
 
 def initialize_db():
     SQLModel.metadata.create_all(engine)
+    schema.upgrade(engine)
+
+def warm_templates():
+    started = time.perf_counter()
+    with Session(engine) as session:
+        query = select(Template).order_by(Template.created_at.desc()) # type: ignore
+        if settings.TEMPLATE_WARMUP_LIMIT:
+            query = query.limit(settings.TEMPLATE_WARMUP_LIMIT)
+        templates = session.exec(query).all()
+    for tpl in templates:
+        try:
+            compile_template(tpl.code, tpl.content)
+            warmup_state['templates_compiled'] += 1
+        except Exception as exc:
+            # a broken template must not keep the replica out of rotation
+            warmup_state['templates_failed'] += 1
+            logger.warning(f"failed to compile template {tpl.code}: {exc}")
+    warmup_state['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    warmup_state['ready'] = True
+    logger.info(f"template warm-up finished: {warmup_state}")
+
+async def warm_up():
+    try:
+        await asyncio.to_thread(warm_templates)
+    except Exception as exc:
+        logger.error(f"template warm-up failed: {exc}")
+        warmup_state['ready'] = True
 
 @asynccontextmanager
 async def lifeSpan(app: FastAPI):
+    tracer_provider = setup_tracing()
     initialize_db()
+    logger.info(f"template bytecode cache: {bytecode_cache_description()}")
+    if settings.TEMPLATE_WARMUP_ENABLED:
+        app.state.warmup_task = asyncio.create_task(warm_up())
+    else:
+        warmup_state['ready'] = True
+    rpc_server = None
+    if settings.RABBITMQ_URL:
+        rpc_server = RenderRpcServer(settings.RABBITMQ_URL, settings.RENDER_RPC_QUEUE, settings.RENDER_RPC_PREFETCH)
+        await rpc_server.start()
     yield
+    if rpc_server is not None:
+        await rpc_server.stop()
+    await render_cache.close()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
 
 app = FastAPI(
     title='Template Service',
@@ -28,12 +102,31 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], all
 async def health():
     return {"status": "ok"}
 
+@app.get('/ready')
+async def ready(response: Response):
+    if not warmup_state['ready']:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "warming", **warmup_state}
+    return {"status": "ready", **warmup_state}
+
 
 @app.post('/templates/', response_model=TemplateOut)
 async def create_template(session: SessionDep, payload: CreateTemplateReq):
     if await crud.get_template_by_code(session=session, code=payload.code):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Template code already exists")
-    tpl = await crud.create_template(session=session, code=payload.code, content=payload.content, language=payload.language)
+    variables = precompile(payload.code, payload.content)
+    tpl = await crud.create_template(session=session, code=payload.code, content=payload.content, variables=variables, language=payload.language, cache_output=payload.cache_output)
+    return tpl
+
+@app.put('/templates/{code}', response_model=TemplateOut)
+async def update_template(session: SessionDep, code: str, payload: UpdateTemplateReq):
+    tpl = await crud.get_template_by_code(session=session, code=code)
+    if not tpl:
+        raise HTTPException(404, 'template not found')
+    changes = payload.model_dump(exclude_none=True)
+    if 'content' in changes:
+        changes['variables'] = precompile(code, changes['content'])
+    tpl = await crud.update_template(session=session, tpl=tpl, **changes)
     return tpl
 
 @app.get('/templates/{code}', response_model=TemplateOut)
@@ -44,9 +137,12 @@ async def get_template(session: SessionDep, code: str):
     return tpl
 
 @app.post('/render/{code}')
-async def render_template(session: SessionDep, code: str, variables: dict):
-    tpl = await crud.get_template_by_code(session=session, code=code)
-    if not tpl:
-        raise HTTPException(404, 'template not found')
-    rendered = tpl.render(variables)
+async def render_template(request: Request, session: SessionDep, code: str, variables: dict):
+    with tracer.start_as_current_span('POST /render/{code}', context=context_from(request.headers), kind=SpanKind.SERVER) as span:
+        span.set_attribute('template.code', code)
+        rendered = await render_by_code(session=session, code=code, variables=variables)
     return {"rendered": rendered}
+
+@app.get('/render/cache/stats')
+async def render_cache_stats():
+    return render_cache.snapshot()
@@ -1,19 +1,27 @@
 from pydantic import BaseModel
 from typing import Optional
-from sqlmodel import SQLModel, Field
-from jinja2 import Template as J2Template
+from sqlmodel import SQLModel, Field, Column, JSON
 from datetime import datetime
+from renderer import compile_template, required_variables
 
 class CreateTemplateReq(BaseModel):
     code: str
     content: str
     language: Optional[str] = 'en'
+    cache_output: bool = False
+
+class UpdateTemplateReq(BaseModel):
+    content: Optional[str] = None
+    language: Optional[str] = None
+    cache_output: Optional[bool] = None
 
 class TemplateOut(BaseModel):
     id: int
     code: str
     content: str
     language: str
+    cache_output: bool
+    variables: list[str]
 
     class Config:
         orm_mode = True
@@ -23,9 +31,20 @@ class Template(SQLModel, table=True):
     code: str = Field(max_length=120, unique=True, index=True, nullable=False)
     content: str = Field(nullable=False)
     language: str = Field(default='en', max_length=10)
+    # opt-in: only cache templates whose output repeats across recipients
+    cache_output: bool = Field(default=False)
+    # names the template reads, extracted with jinja2.meta when it is saved
+    variables: list[str] = Field(default_factory=list, sa_column=Column(JSON, nullable=False))
     created_at: datetime = Field(default_factory=datetime.now)
 
     def render(self, vars: dict) -> str:
-        j = J2Template(self.content)
+        j = compile_template(self.code, self.content)
         return j.render(**(vars or {}))
-    
+
+    def missing_variables(self, vars: dict | None) -> list[str]:
+        # optional names (default filter, is defined, if guards) may be left out
+        return [name for name in required_variables(self.content) if name not in (vars or {})]
+
+    def used_variables(self, vars: dict | None) -> dict:
+        return {name: vars[name] for name in self.variables if name in (vars or {})}
+
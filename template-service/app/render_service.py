@@ -0,0 +1,35 @@
+from fastapi.exceptions import HTTPException
+
+from cache import render_cache
+from core.config import settings
+from deps import SessionDep
+from tracing import tracer
+import crud
+
+
+async def render_by_code(session: SessionDep, code: str, variables: dict) -> str:
+    # shared by the HTTP endpoint and the RPC consumer so both transports behave the same
+    with tracer.start_as_current_span('template.lookup'):
+        tpl = await crud.get_template_by_code(session=session, code=code)
+    if not tpl:
+        raise HTTPException(404, 'template not found')
+    if settings.TEMPLATE_STRICT_VARIABLES:
+        missing = tpl.missing_variables(variables)
+        if missing:
+            raise HTTPException(
+                status_code=422,
+                detail={"message": "missing template variables", "missing_variables": missing},
+            )
+    with tracer.start_as_current_span('template.render') as span:
+        if not (settings.RENDER_CACHE_ENABLED and tpl.cache_output):
+            span.set_attribute('render.cache', 'off')
+            return tpl.render(variables)
+
+        # only the variables the template reads can change its output
+        key = render_cache.key(tpl.code, tpl.content, tpl.used_variables(variables))
+        rendered = await render_cache.get(key)
+        span.set_attribute('render.cache', 'miss' if rendered is None else 'hit')
+        if rendered is None:
+            rendered = tpl.render(variables)
+            await render_cache.set(key, rendered)
+        return rendered
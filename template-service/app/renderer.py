@@ -0,0 +1,132 @@
+import logging
+from functools import lru_cache
+
+from jinja2 import BytecodeCache, Environment, FileSystemBytecodeCache, MemcachedBytecodeCache, meta, nodes
+from jinja2 import Template as J2Template
+import redis
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def build_bytecode_cache() -> BytecodeCache | None:
+    backend = settings.TEMPLATE_BYTECODE_CACHE
+    if backend == 'filesystem':
+        directory = settings.TEMPLATE_BYTECODE_CACHE_DIR
+        return FileSystemBytecodeCache(directory) if directory else FileSystemBytecodeCache()
+    if backend == 'redis':
+        if not settings.TEMPLATE_BYTECODE_CACHE_REDIS_URL:
+            raise Exception('TEMPLATE_BYTECODE_CACHE_REDIS_URL NOT SET')
+        # redis' set(name, value, ex) matches the memcached client interface jinja expects
+        client = redis.Redis.from_url(settings.TEMPLATE_BYTECODE_CACHE_REDIS_URL)
+        return MemcachedBytecodeCache(client, prefix='jinja2/bytecode/', timeout=None, ignore_memcache_errors=True)
+    return None
+
+
+env = Environment(bytecode_cache=build_bytecode_cache())
+
+
+def bytecode_cache_description() -> str:
+    bcc = env.bytecode_cache
+    if isinstance(bcc, FileSystemBytecodeCache):
+        if settings.TEMPLATE_BYTECODE_CACHE_DIR:
+            return f'filesystem at {bcc.directory}'
+        # jinja's default is a temp dir inside the container: lost on redeploy, never shared
+        return f'filesystem at {bcc.directory} (per-container; set TEMPLATE_BYTECODE_CACHE_DIR to a shared volume)'
+    if isinstance(bcc, MemcachedBytecodeCache):
+        return 'redis (shared)'
+    return 'none'
+
+
+@lru_cache(maxsize=settings.TEMPLATE_COMPILE_CACHE_SIZE)
+def compile_template(code: str, content: str) -> J2Template:
+    # same steps as jinja's loaders: reuse shared bytecode when the source checksum matches
+    bcc = env.bytecode_cache
+    bucket = None
+    compiled = None
+    if bcc is not None:
+        bucket = bcc.get_bucket(env, code, None, content)
+        compiled = bucket.code
+    if compiled is None:
+        compiled = env.compile(content, code)
+        if bucket is not None:
+            bucket.code = compiled
+            bcc.set_bucket(bucket)
+    return env.template_class.from_code(env, compiled, env.make_globals(None))
+
+
+def declared_variables(content: str) -> list[str]:
+    # raises jinja2.TemplateSyntaxError for broken templates
+    return sorted(meta.find_undeclared_variables(env.parse(content)))
+
+
+# filters and tests that make an undefined variable safe to render
+DEFAULT_FILTERS = {'default', 'd'}
+DEFINED_TESTS = {'defined', 'undefined', 'none'}
+# an undefined value is falsy, so a bare name under these is safe in a test
+BOOLEAN_NODES = (nodes.Not, nodes.And, nodes.Or)
+
+
+def _proven_names(test: nodes.Node) -> set[str]:
+    """Names a passing test proves are set: bare names and ``is defined``, joined by ``and``."""
+    if isinstance(test, nodes.Name):
+        return {test.name}
+    if isinstance(test, nodes.Test) and test.name == 'defined' and isinstance(test.node, nodes.Name):
+        return {test.node.name}
+    if isinstance(test, nodes.And):
+        return _proven_names(test.left) | _proven_names(test.right)
+    # a passing `not` or `or` does not say which name is set
+    return set()
+
+
+def _collect_required(node: nodes.Node, required: set[str], guarded: frozenset = frozenset(),
+                      parent: nodes.Node | None = None, in_test: bool = False):
+    if isinstance(node, nodes.If):
+        _collect_required(node.test, required, guarded, node, in_test=True)
+        for child in node.body:
+            _collect_required(child, required, guarded | _proven_names(node.test), node)
+        # elif and else run because the test failed, which proves nothing
+        for child in [*node.elif_, *node.else_]:
+            _collect_required(child, required, guarded, node)
+        return
+    if isinstance(node, nodes.CondExpr):
+        _collect_required(node.test, required, guarded, node, in_test=True)
+        _collect_required(node.expr1, required, guarded | _proven_names(node.test), node, in_test)
+        if node.expr2 is not None:
+            _collect_required(node.expr2, required, guarded, node, in_test)
+        return
+    if isinstance(node, nodes.And):
+        # the right operand is only evaluated when the left one was truthy
+        _collect_required(node.left, required, guarded, node, in_test)
+        _collect_required(node.right, required, guarded | _proven_names(node.left), node, in_test)
+        return
+    if isinstance(node, nodes.Name):
+        if node.ctx != 'load' or node.name in guarded:
+            return
+        if isinstance(parent, nodes.Filter) and parent.name in DEFAULT_FILTERS and parent.node is node:
+            return
+        if isinstance(parent, nodes.Test) and parent.name in DEFINED_TESTS and parent.node is node:
+            return
+        if in_test:
+            return
+        required.add(node.name)
+        return
+    for child in node.iter_child_nodes():
+        _collect_required(child, required, guarded, node, in_test and isinstance(node, BOOLEAN_NODES))
+
+
+@lru_cache(maxsize=settings.TEMPLATE_COMPILE_CACHE_SIZE)
+def required_variables(content: str) -> tuple[str, ...]:
+    """The declared variables a render cannot do without.
+
+    Leaves out names that are only read through ``default``, checked with
+    ``is defined``, used as a bare ``if`` test, or read inside the body of an
+    ``if`` whose passing test proves them set; Jinja renders all of those fine
+    when the name is missing. ``else``/``elif`` branches and names under
+    ``not`` or ``or`` are not guarded.
+    """
+    declared = meta.find_undeclared_variables(env.parse(content))
+    required: set[str] = set()
+    _collect_required(env.parse(content), required)
+    return tuple(sorted(required & declared))
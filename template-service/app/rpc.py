@@ -0,0 +1,99 @@
+import json
+import logging
+
+import aio_pika
+import msgpack
+from fastapi.exceptions import HTTPException
+from opentelemetry.trace import SpanKind
+from sqlmodel import Session
+
+from core.db import engine
+from render_service import render_by_code
+from tracing import context_from, tracer
+
+logger = logging.getLogger(__name__)
+
+MSGPACK = 'application/msgpack'
+
+
+def decode(message: aio_pika.abc.AbstractIncomingMessage) -> dict:
+    if message.content_type == 'application/json':
+        return json.loads(message.body)
+    return msgpack.unpackb(message.body)
+
+
+def encode(payload: dict, content_type: str) -> bytes:
+    if content_type == 'application/json':
+        return json.dumps(payload).encode()
+    return msgpack.packb(payload)
+
+
+class RenderRpcServer:
+    """Serves render requests from a RabbitMQ queue, replying to `reply_to` with the request's correlation id.
+
+    Request body: {"code": str, "variables": dict}
+    Reply body: {"rendered": str} or {"error": {"status": int, "detail": ...}}
+    """
+
+    def __init__(self, url: str, queue_name: str, prefetch: int):
+        self.url = url
+        self.queue_name = queue_name
+        self.prefetch = prefetch
+        self.connection: aio_pika.abc.AbstractRobustConnection | None = None
+        self.channel: aio_pika.abc.AbstractChannel | None = None
+
+    async def start(self):
+        self.connection = await aio_pika.connect_robust(self.url)
+        self.channel = await self.connection.channel()
+        # prefetch bounds how many pipelined requests are in flight per replica
+        await self.channel.set_qos(prefetch_count=self.prefetch)
+        queue = await self.channel.declare_queue(self.queue_name, durable=True)
+        await queue.consume(self.on_request)
+        logger.info(f"render rpc listening on {self.queue_name}")
+
+    async def stop(self):
+        if self.connection is not None:
+            await self.connection.close()
+
+    async def handle(self, request: dict) -> dict:
+        code = request.get('code')
+        variables = request.get('variables') or {}
+        if not isinstance(code, str) or not isinstance(variables, dict):
+            return {"error": {"status": 400, "detail": "code and variables are required"}}
+        try:
+            with Session(engine) as session:
+                rendered = await render_by_code(session=session, code=code, variables=variables)
+        except HTTPException as exc:
+            return {"error": {"status": exc.status_code, "detail": exc.detail}}
+        return {"rendered": rendered}
+
+    async def on_request(self, message: aio_pika.abc.AbstractIncomingMessage):
+        async with message.process(requeue=False):
+            content_type = message.content_type or MSGPACK
+            with tracer.start_as_current_span(
+                f'{self.queue_name} process', context=context_from(message.headers), kind=SpanKind.CONSUMER,
+            ) as span:
+                try:
+                    request = decode(message)
+                except Exception as exc:
+                    response = {"error": {"status": 400, "detail": f"undecodable request: {exc}"}}
+                else:
+                    span.set_attribute('template.code', str(request.get('code')))
+                    try:
+                        response = await self.handle(request)
+                    except Exception as exc:
+                        logger.exception('render rpc request failed')
+                        response = {"error": {"status": 500, "detail": str(exc)}}
+                if 'error' in response:
+                    span.set_attribute('render.error_status', response['error']['status'])
+
+            if not message.reply_to:
+                return
+            await self.channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=encode(response, content_type),
+                    content_type=content_type,
+                    correlation_id=message.correlation_id,
+                ),
+                routing_key=message.reply_to,
+            )
@@ -0,0 +1,64 @@
+"""Startup schema upgrades for the template table.
+
+The service creates its tables with ``create_all``, which never alters a table
+that already exists, so columns added since a deployment was created are added
+here, with defaults, and backfilled.
+"""
+import logging
+
+from jinja2 import TemplateSyntaxError
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from models import Template
+from renderer import declared_variables
+
+logger = logging.getLogger(__name__)
+
+# column -> SQL default for rows that predate it
+ADDED_COLUMNS = {
+    'cache_output': 'FALSE',
+    'variables': "'[]'",
+}
+
+
+def add_missing_columns(engine: Engine) -> set[str]:
+    table = Template.__table__
+    existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    added = set()
+    with engine.begin() as conn:
+        for name, default in ADDED_COLUMNS.items():
+            if name in existing:
+                continue
+            column_type = table.c[name].type.compile(dialect=engine.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {column_type} NOT NULL DEFAULT {default}'))
+            added.add(name)
+            logger.info(f"added column {table.name}.{name}")
+    return added
+
+
+def backfill_variables(engine: Engine) -> int:
+    """Fill ``variables`` for rows that have none, so strict checks and cache keys see every name."""
+    filled = 0
+    with Session(engine) as session:
+        for tpl in session.exec(select(Template)).all():
+            if tpl.variables:
+                continue
+            try:
+                variables = declared_variables(tpl.content)
+            except TemplateSyntaxError as exc:
+                logger.warning(f"cannot backfill variables of template {tpl.code}: {exc}")
+                continue
+            if variables:
+                tpl.variables = variables
+                session.add(tpl)
+                filled += 1
+        session.commit()
+    return filled
+
+
+def upgrade(engine: Engine):
+    added = add_missing_columns(engine)
+    if 'variables' in added:
+        logger.info(f"backfilled variables for {backfill_variables(engine)} templates")
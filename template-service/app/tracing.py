@@ -0,0 +1,53 @@
+"""OpenTelemetry tracing: sampled spans exported to a local file or a collector.
+
+Trace context arrives as W3C ``traceparent``/``tracestate`` in HTTP headers or
+AMQP message headers. Sampling is parent-based: a request that is part of a
+sampled trace is always recorded, new traces are kept at TRACE_SAMPLE_RATIO.
+"""
+import os
+from typing import Mapping
+
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+from core.config import settings
+
+tracer = trace.get_tracer('template-service')
+
+
+def make_exporter():
+    if settings.TRACE_EXPORTER == 'file':
+        out = open(settings.TRACE_FILE, 'a', buffering=1)
+        # one JSON span per line
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep)
+    if settings.TRACE_EXPORTER == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=settings.TRACE_OTLP_ENDPOINT)
+    return None
+
+
+def setup_tracing() -> TracerProvider | None:
+    exporter = make_exporter()
+    if exporter is None:
+        # the API's default no-op provider stays in place; spans cost next to nothing
+        return None
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': 'template-service'}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACE_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def context_from(headers: Mapping | None):
+    """Trace context from HTTP or AMQP headers (AMQP values may arrive as bytes)."""
+    carrier = {
+        str(key).lower(): value.decode() if isinstance(value, bytes) else str(value)
+        for key, value in (headers or {}).items()
+    }
+    return extract(carrier)
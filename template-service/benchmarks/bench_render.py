@@ -0,0 +1,377 @@
+"""Render benchmarks for template-service.
+
+Runs against an in-memory SQLite database, so no Postgres is needed:
+
+    python benchmarks/bench_render.py --output results.json
+    python benchmarks/bench_render.py --compare results.json
+
+Each case reports ops/sec, p50/p99 latency and tracemalloc figures
+(peak and retained bytes per op). `--compare` prints the change against a
+previous run and exits non-zero when a case regresses past the threshold.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault('POSTGRE_DATABASE_URL', 'sqlite://')
+os.environ.setdefault('TEMPLATE_WARMUP_ENABLED', 'false')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import crud
+import main as service
+from cache import render_cache
+from core.config import settings
+from deps import get_session
+from models import Template
+import renderer
+from renderer import compile_template, declared_variables
+
+logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+
+
+def build_templates(variable_count: int, loop_items: int, large_paragraphs: int) -> dict[str, tuple[str, dict]]:
+    small = (
+        'Hi {{ name }}, your order {{ order_id }} has shipped.',
+        {'name': 'Ada', 'order_id': 'A-1001'},
+    )
+    large = (
+        '\n'.join(
+            f'<p>Section {i}: hello {{{{ name }}}}, this is filler text for paragraph {i}.</p>'
+            for i in range(large_paragraphs)
+        ),
+        {'name': 'Ada'},
+    )
+    loop = (
+        '<ul>{% for item in items %}<li>{{ item.name }} x {{ item.qty }}</li>{% endfor %}</ul>',
+        {'items': [{'name': f'item-{i}', 'qty': i} for i in range(loop_items)]},
+    )
+    many_vars = (
+        ' '.join(f'{{{{ v{i} }}}}' for i in range(variable_count)),
+        {f'v{i}': f'value-{i}' for i in range(variable_count)},
+    )
+    return {'small': small, 'large': large, 'loop': loop, 'vars': many_vars}
+
+
+def summarize(name: str, params: dict, latencies_ns: list[int], elapsed: float, ops: int, memory: dict) -> dict:
+    latencies_us = sorted(ns / 1000 for ns in latencies_ns)
+    p99_index = max(0, int(round(len(latencies_us) * 0.99)) - 1)
+    return {
+        'name': name,
+        'params': params,
+        'ops': ops,
+        'ops_per_sec': round(ops / elapsed, 2) if elapsed else None,
+        'mean_us': round(statistics.fmean(latencies_us), 2),
+        'p50_us': round(statistics.median(latencies_us), 2),
+        'p99_us': round(latencies_us[p99_index], 2),
+        **memory,
+    }
+
+
+def measure_memory(fn, ops: int) -> dict:
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(ops):
+            fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'peak_bytes_per_op': round((peak - baseline) / ops, 1),
+        'retained_bytes_per_op': round((current - baseline) / ops, 1),
+    }
+
+
+def bench(name: str, fn, iterations: int, params: dict | None = None, setup=None) -> dict:
+    for _ in range(min(10, iterations)):
+        if setup:
+            setup()
+        fn()
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if setup:
+            setup()
+        t0 = time.perf_counter_ns()
+        fn()
+        latencies.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - started
+
+    def op():
+        if setup:
+            setup()
+        fn()
+
+    memory = measure_memory(op, max(1, iterations // 10))
+    return summarize(name, params or {}, latencies, elapsed, iterations, memory)
+
+
+async def bench_concurrent(name: str, request, total: int, concurrency: int, params: dict) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[int] = []
+
+    async def one():
+        async with semaphore:
+            t0 = time.perf_counter_ns()
+            await request()
+            latencies.append(time.perf_counter_ns() - t0)
+
+    await asyncio.gather(*(one() for _ in range(min(10, total))))
+    latencies.clear()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    timings = list(latencies)
+
+    memory_ops = max(1, total // 10)
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await asyncio.gather(*(one() for _ in range(memory_ops)))
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    memory = {
+        'peak_bytes_per_op': round((peak - baseline) / memory_ops, 1),
+        'retained_bytes_per_op': round((current - baseline) / memory_ops, 1),
+    }
+    return summarize(name, {**params, 'concurrency': concurrency}, timings, elapsed, total, memory)
+
+
+def make_engine():
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def seed(engine, templates: dict[str, tuple[str, dict]], cached: set[str]):
+    with Session(engine) as session:
+        for code, (content, _) in templates.items():
+            session.add(Template(code=code, content=content, variables=declared_variables(content), cache_output=False))
+        for code in cached:
+            content, _ = templates[code]
+            session.add(Template(code=f'{code}-cached', content=content, variables=declared_variables(content), cache_output=True))
+        session.commit()
+
+
+@contextmanager
+def bytecode_cache_disabled():
+    bcc = renderer.env.bytecode_cache
+    renderer.env.bytecode_cache = None
+    try:
+        yield
+    finally:
+        renderer.env.bytecode_cache = bcc
+
+
+def run_render_cases(engine, templates, iterations: int) -> list[dict]:
+    results = []
+    with Session(engine) as session:
+        for code, (content, variables) in templates.items():
+            tpl = session.exec(select(Template).where(Template.code == code)).one()
+            size = {'template': code, 'content_bytes': len(content)}
+            # cold: nothing cached anywhere, every op parses and compiles the source
+            with bytecode_cache_disabled():
+                results.append(bench('render_cold', lambda: tpl.render(variables), iterations, size,
+                                     setup=compile_template.cache_clear))
+            if renderer.env.bytecode_cache is not None:
+                # a fresh worker: the LRU is empty but the shared bytecode cache is not
+                results.append(bench('render_bytecode_warm', lambda: tpl.render(variables), iterations, size,
+                                     setup=compile_template.cache_clear))
+            results.append(bench('render_warm', lambda: tpl.render(variables), iterations, size))
+    return results
+
+
+def run_batch_cases(engine, templates, iterations: int, batch_size: int) -> list[dict]:
+    content, variables = templates['small']
+    recipients = [{**variables, 'name': f'user-{i}'} for i in range(batch_size)]
+    params = {'template': 'small', 'batch_size': batch_size}
+
+    def single():
+        # one lookup + render per recipient, like one /render call each
+        with Session(engine) as session:
+            for item in recipients:
+                tpl = session.exec(select(Template).where(Template.code == 'small')).one()
+                tpl.render(item)
+
+    def batch():
+        with Session(engine) as session:
+            tpl = session.exec(select(Template).where(Template.code == 'small')).one()
+            for item in recipients:
+                tpl.render(item)
+
+    per_batch = max(1, iterations // batch_size)
+    return [
+        bench('render_single_per_recipient', single, per_batch, params),
+        bench('render_batch', batch, per_batch, params),
+    ]
+
+
+def run_session_cases(engine, iterations: int) -> list[dict]:
+    async def sync_lookup():
+        with Session(engine) as session:
+            await crud.get_template_by_code(session=session, code='small')
+
+    results = [asyncio.run(bench_concurrent('lookup_sync_session', sync_lookup, iterations, 1, {'template': 'small'}))]
+
+    try:
+        import aiosqlite  # noqa: F401
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from sqlmodel.ext.asyncio.session import AsyncSession
+    except ImportError:
+        print('aiosqlite not installed; skipping async session case', file=sys.stderr)
+        return results
+
+    async def run_async():
+        async_engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(async_engine) as session:
+            session.add(Template(code='small', content='Hi {{ name }}'))
+            await session.commit()
+
+        async def async_lookup():
+            async with AsyncSession(async_engine) as session:
+                result = await session.exec(select(Template).where(Template.code == 'small'))
+                result.first()
+
+        result = await bench_concurrent('lookup_async_session', async_lookup, iterations, 1, {'template': 'small'})
+        await async_engine.dispose()
+        return result
+
+    results.append(asyncio.run(run_async()))
+    return results
+
+
+def run_endpoint_cases(engine, templates, iterations: int, concurrency_levels: list[int]) -> list[dict]:
+    def session_override():
+        with Session(engine) as session:
+            yield session
+
+    service.app.dependency_overrides[get_session] = session_override
+    results = []
+    # no context manager: skip the lifespan so the benchmark never touches the configured database
+    client = TestClient(service.app)
+    for code in ('small', 'loop'):
+        _, variables = templates[code]
+        results.append(bench('endpoint_sync_client', lambda: client.post(f'/render/{code}', json=variables),
+                             iterations, {'template': code}))
+    _, variables = templates['small']
+    results.append(bench('endpoint_sync_client_cached', lambda: client.post('/render/small-cached', json=variables),
+                         iterations, {'template': 'small', 'cache_output': True}))
+
+    async def run_async():
+        transport = httpx.ASGITransport(app=service.app)
+        out = []
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as async_client:
+            for concurrency in concurrency_levels:
+                out.append(await bench_concurrent(
+                    'endpoint_async_concurrent',
+                    lambda: async_client.post('/render/small', json=variables),
+                    iterations, concurrency, {'template': 'small'},
+                ))
+        return out
+
+    results.extend(asyncio.run(run_async()))
+    service.app.dependency_overrides.clear()
+    return results
+
+
+def compare(current: dict, baseline_path: str, threshold: float) -> int:
+    baseline = json.loads(Path(baseline_path).read_text())
+
+    def key(result):
+        return result['name'], json.dumps(result['params'], sort_keys=True)
+
+    previous = {key(r): r for r in baseline['results']}
+    regressions = 0
+    print(f"{'case':<60} {'ops/s':>12} {'delta':>9} {'p99 us':>10} {'delta':>9}")
+    for result in current['results']:
+        old = previous.get(key(result))
+        label = f"{result['name']} {json.dumps(result['params'], sort_keys=True)}"[:60]
+        if not old:
+            print(f"{label:<60} {result['ops_per_sec']:>12} {'new':>9}")
+            continue
+        ops_delta = (result['ops_per_sec'] - old['ops_per_sec']) / old['ops_per_sec'] * 100
+        p99_delta = (result['p99_us'] - old['p99_us']) / old['p99_us'] * 100 if old['p99_us'] else 0.0
+        flag = ''
+        if ops_delta < -threshold or p99_delta > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{label:<60} {result['ops_per_sec']:>12} {ops_delta:>8.1f}% {result['p99_us']:>10} {p99_delta:>8.1f}%{flag}")
+    return 1 if regressions else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='template-service render benchmarks')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--variables', type=int, default=50)
+    parser.add_argument('--loop-items', type=int, default=500)
+    parser.add_argument('--large-paragraphs', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--only', choices=['render', 'batch', 'session', 'endpoint'], nargs='+')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    groups = set(args.only or ['render', 'batch', 'session', 'endpoint'])
+    templates = build_templates(args.variables, args.loop_items, args.large_paragraphs)
+    engine = make_engine()
+    seed(engine, templates, cached={'small'})
+
+    results = []
+    if 'render' in groups:
+        results += run_render_cases(engine, templates, args.iterations)
+    if 'batch' in groups:
+        results += run_batch_cases(engine, templates, args.iterations, args.batch_size)
+    if 'session' in groups:
+        results += run_session_cases(engine, args.iterations)
+    if 'endpoint' in groups:
+        results += run_endpoint_cases(engine, templates, args.iterations, args.concurrency)
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'bytecode_cache': settings.TEMPLATE_BYTECODE_CACHE,
+        'render_cache': render_cache.snapshot(),
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        sys.exit(compare(report, args.compare, args.threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault('POSTGRE_DATABASE_URL', 'sqlite://')
+os.environ.setdefault('TEMPLATE_WARMUP_ENABLED', 'false')
+os.environ.setdefault('TEMPLATE_BYTECODE_CACHE', 'none')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
@@ -0,0 +1,53 @@
+import pytest
+from jinja2 import UndefinedError
+
+from models import Template
+from renderer import env, required_variables
+
+
+def renders_without(content: str, missing: set[str], variables: dict) -> bool:
+    try:
+        env.from_string(content).render(**{k: v for k, v in variables.items() if k not in missing})
+    except UndefinedError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize('content, required', [
+    ('Hi {{ name }}', ('name',)),
+    ('Hi {{ name|default("there") }}', ()),
+    ('Hi {{ name|d("there") }}', ()),
+    ('{% if name is defined %}Hi {{ name }}{% endif %}', ()),
+    ('{% if coupon %}Use {{ coupon }}{% endif %}', ()),
+    ('{% if user %}Hi {{ user.name }}{% endif %}', ()),
+    ('{% if user and user.name %}Hi {{ user.name }}{% endif %}', ()),
+    ('{{ user.name if user else "there" }}', ()),
+    ('{% if not coupon %}No coupon{% endif %}', ()),
+    ('{% if a %}{{ b }}{% else %}{{ a.name }}{% endif %}', ('a', 'b')),
+    ('{% if a %}x{% elif b %}{{ a.name }}{% endif %}', ('a',)),
+    ('{% if not a %}{{ a.b }}{% endif %}', ('a',)),
+    ('{% if a or b %}{{ b.c.d }}{% endif %}', ('b',)),
+    ('{% if a is not defined %}{{ a.b }}{% endif %}', ('a',)),
+    ('{{ "x" if a else b.c }}', ('b',)),
+    ('{% for item in items %}{{ item.name }}{% endfor %}', ('items',)),
+])
+def test_required_variables(content, required):
+    assert required_variables(content) == required
+
+
+@pytest.mark.parametrize('content, variables', [
+    ('{% if a %}{{ b }}{% else %}{{ a.name }}{% endif %}', {'a': {'name': 'x'}, 'b': 'y'}),
+    ('{% if not a %}{{ a.b }}{% endif %}', {'a': {'b': 'x'}}),
+    ('{% if a or b %}{{ b.c.d }}{% endif %}', {'a': 1, 'b': {'c': {'d': 'x'}}}),
+    ('{% if user and user.name %}Hi {{ user.name }}{% endif %}', {'user': {'name': 'Ada'}}),
+    ('{{ name|default("there") }} {% if name is defined %}{{ name.upper() }}{% endif %}', {'name': 'ada'}),
+])
+def test_optional_variables_render_when_missing(content, variables):
+    optional = set(variables) - set(required_variables(content))
+    assert renders_without(content, optional, variables)
+
+
+def test_missing_variables_only_lists_required_names():
+    tpl = Template(code='offer', content='Hi {{ name }}{% if coupon %}, use {{ coupon }}{% endif %}')
+    assert tpl.missing_variables({}) == ['name']
+    assert tpl.missing_variables({'name': 'Ada'}) == []
@@ -0,0 +1,115 @@
+"""Compare requests/sec and tail latency of the WSGI and ASGI profiles.
+
+Start the service twice against the same database, e.g.
+
+    SERVER_PROFILE=wsgi PORT=8000 ./serve.sh
+    SERVER_PROFILE=asgi PORT=8001 ./serve.sh
+
+then run (needs httpx):
+
+    python loadtest/compare_servers.py \\
+        --target wsgi=http://localhost:8000 --target asgi=http://localhost:8001 \\
+        --token <service token> --user-id <uuid> --user-id <uuid> \\
+        --requests 2000 --concurrency 100 --output results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+
+import httpx
+
+
+def endpoints(user_ids):
+    ids = itertools.cycle(user_ids)
+    return {
+        'user': lambda: ('GET', f'/api/users/{next(ids)}/', None),
+        'preferences': lambda: ('GET', f'/api/users/{next(ids)}/preferences/', None),
+        'push_tokens': lambda: ('GET', f'/api/users/{next(ids)}/push-tokens/', None),
+        'bulk_recipients': lambda: ('POST', '/api/users/bulk/recipients/', {'user_ids': user_ids}),
+    }
+
+
+async def run_endpoint(client, make_request, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        method, path, body = make_request()
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors,
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(latencies[max(0, int(len(latencies) * 0.99) - 1)], 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+
+async def run(args):
+    targets = dict(target.split('=', 1) for target in args.target)
+    headers = {'Authorization': f'Bearer {args.token}'}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    for name, base_url in targets.items():
+        results[name] = {}
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+            for endpoint, make_request in endpoints(args.user_id).items():
+                if args.only and endpoint not in args.only:
+                    continue
+                # warm connections and caches so both profiles are measured hot
+                await run_endpoint(client, make_request, min(args.concurrency, args.requests), args.concurrency)
+                results[name][endpoint] = await run_endpoint(client, make_request, args.requests, args.concurrency)
+    return results
+
+
+def print_table(results):
+    names = list(results)
+    endpoints_ = list(results[names[0]])
+    print(f"{'endpoint':<18}" + ''.join(f"{name + ' rps':>14}{name + ' p99':>14}" for name in names))
+    for endpoint in endpoints_:
+        row = f"{endpoint:<18}"
+        for name in names:
+            r = results[name][endpoint]
+            row += f"{r['rps']:>14}{r['p99_ms']:>12}ms"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='user-service WSGI vs ASGI load test')
+    parser.add_argument('--target', action='append', required=True, help='name=base_url, repeatable')
+    parser.add_argument('--token', required=True, help='service token (manage.py issue_service_token) or a staff access token; bulk_recipients rejects other users')
+    parser.add_argument('--user-id', action='append', required=True)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--only', nargs='+', choices=['user', 'preferences', 'push_tokens', 'bulk_recipients'])
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+#!/bin/sh
+# Starts the service under the selected profile:
+#   SERVER_PROFILE=wsgi (default)  sync gunicorn workers, DRF views
+#   SERVER_PROFILE=asgi            uvicorn workers, async views for the hot read endpoints
+# PORT defaults to 8000; worker count comes from gunicorn's own WEB_CONCURRENCY variable.
+set -e
+
+if [ "${SERVER_PROFILE:-wsgi}" = "asgi" ]; then
+    export USER_ASYNC_VIEWS="${USER_ASYNC_VIEWS:-true}"
+    exec gunicorn user_service.asgi:application -k uvicorn_worker.UvicornWorker --bind "0.0.0.0:${PORT:-8000}"
+fi
+
+exec gunicorn user_service.wsgi:application --bind "0.0.0.0:${PORT:-8000}"
@@ -0,0 +1,150 @@
+"""Async versions of the read-heavy endpoints, for the ASGI deployment profile.
+
+DRF views are sync-only, so under ASGI each request would hop to a worker
+thread. These views answer GET (and the bulk lookup POST) with the async ORM
+and async cache API and hand every other method to the existing DRF view, so
+the URLs and response bodies stay the same. Enabled with ``USER_ASYNC_VIEWS``.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from . import cache as user_cache
+from .authentication import ClaimsJWTAuthentication, IsServiceOrStaff
+from .models import User, PushToken, NotificationPreferences
+from .recipients import aiter_recipient_chunks, recipient_lines, recipients_envelope
+from .serializers import (UserSerializer, PushTokenSerializer, NotificationPreferenceSerializer,
+                          BulkRecipientLookupSerializer)
+from .views import UserRetrieveView, PreferencesRetrieveUpdateView, PushTokenCreateView, wants_stream
+
+
+class NotFound(Exception):
+    pass
+
+
+def error(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+async def authenticate(request, permission=None):
+    """Validate the bearer token (and ``permission``); returns an error response, or None when the caller is allowed."""
+    auth = ClaimsJWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        return error(401, 'Authentication credentials were not provided.')
+    try:
+        request.user = await auth.aget_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError):
+        return error(401, 'Given token not valid for any token type')
+    except AuthenticationFailed as exc:
+        return error(401, str(exc.detail))
+    if permission is not None and not await sync_to_async(permission().has_permission)(request, None):
+        return error(403, 'You do not have permission to perform this action.')
+    return None
+
+
+def cached_json(request, data, tag):
+    if user_cache.not_modified(request, tag):
+        response = HttpResponse(status=304)
+    else:
+        response = JsonResponse(data, safe=False)
+    response['ETag'] = tag
+    return response
+
+
+def read_view(async_get, fallback_view):
+    """Serve GET with ``async_get`` and delegate other methods to the sync DRF view."""
+    fallback = sync_to_async(fallback_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await fallback(request, *args, **kwargs)
+        try:
+            return await async_get(request, *args, **kwargs)
+        except NotFound:
+            return error(404, 'No User matches the given query.')
+
+    # DRF views are csrf exempt; the async ones must match for the delegated methods
+    view.csrf_exempt = True
+    return view
+
+
+async def get_user(request, pk):
+    try:
+        user = await User.objects.aget(pk=pk)
+    except User.DoesNotExist:
+        raise NotFound
+    return JsonResponse(UserSerializer(user).data)
+
+
+async def get_preferences(request, user_id):
+    denied = await authenticate(request)
+    if denied:
+        return denied
+
+    async def load():
+        preferences = await NotificationPreferences.objects.filter(user_id=user_id).afirst()
+        if preferences is None:
+            if not await User.objects.filter(id=user_id).aexists():
+                raise NotFound
+            preferences = NotificationPreferences()
+        return dict(NotificationPreferenceSerializer(preferences).data)
+
+    version, data = await user_cache.aget_or_load(user_id, 'preferences', load)
+    return cached_json(request, data, user_cache.etag('preferences', version))
+
+
+async def get_push_tokens(request, user_id):
+    denied = await authenticate(request)
+    if denied:
+        return denied
+
+    async def load():
+        tokens = [token async for token in
+                  PushToken.objects.filter(user_id=user_id, is_active=True).order_by('-created_at')]
+        if not tokens and not await User.objects.filter(id=user_id).aexists():
+            raise NotFound
+        return [dict(token) for token in PushTokenSerializer(tokens, many=True).data]
+
+    version, data = await user_cache.aget_or_load(user_id, 'push_tokens', load)
+    return cached_json(request, data, user_cache.etag('push_tokens', version))
+
+
+async def bulk_recipients(request):
+    if request.method != 'POST':
+        return error(405, f'Method "{request.method}" not allowed.')
+    denied = await authenticate(request, IsServiceOrStaff)
+    if denied:
+        return denied
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return error(400, 'JSON parse error')
+    serializer = BulkRecipientLookupSerializer(data=body)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    user_ids = serializer.validated_data['user_ids']
+
+    if wants_stream(request):
+        async def lines():
+            async for chunk, missing in aiter_recipient_chunks(user_ids):
+                for line in recipient_lines(chunk, missing):
+                    yield line
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+    recipients, not_found = [], []
+    async for chunk, missing in aiter_recipient_chunks(user_ids):
+        recipients.extend(chunk)
+        not_found.extend(missing)
+    return JsonResponse(recipients_envelope(recipients, not_found, len(user_ids)))
+
+
+bulk_recipients.csrf_exempt = True
+
+user_retrieve = read_view(get_user, UserRetrieveView.as_view())
+preferences = read_view(get_preferences, PreferencesRetrieveUpdateView.as_view())
+push_tokens = read_view(get_push_tokens, PushTokenCreateView.as_view())
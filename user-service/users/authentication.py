@@ -0,0 +1,102 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from . import cache as user_cache
+
+SERVICE_SCOPE = 'service'
+
+
+class ServiceUser:
+    """Request user for pipeline services authenticated with a service-scoped token."""
+    is_active = True
+    is_staff = False
+    is_superuser = False
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, token):
+        self.token = token
+        self.service = token['service']
+        self.id = self.pk = f'service:{self.service}'
+
+    def __str__(self):
+        return self.id
+
+
+def service_user(validated_token):
+    # revocation without a DB: drop the service from the allowlist, or raise the
+    # not-before timestamp to invalidate every service token issued earlier
+    service = validated_token.get('service')
+    if service not in settings.SERVICE_TOKEN_SERVICES:
+        raise AuthenticationFailed(_('Service is not allowed'), code='service_not_allowed')
+    if validated_token.get('iat', 0) < settings.SERVICE_TOKEN_NOT_BEFORE:
+        raise AuthenticationFailed(_('Service token has been revoked'), code='token_revoked')
+    return ServiceUser(validated_token)
+
+
+def user_id_claim(validated_token):
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+    return user_id
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts verified claims instead of loading the User row.
+
+    Service-scoped tokens never touch the database. User tokens are checked
+    against a short-TTL cache of the user's active status when
+    ``JWT_TRUST_CLAIMS`` is on, and fall back to the stock DB lookup otherwise.
+
+    The claims callers may trust from the resulting ``TokenUser`` are the user
+    id and ``email``. Staff and superuser status are never taken from a token:
+    ``TokenUser.is_staff`` is always False, so staff-only views use
+    ``IsStaffUser``, which reads the User row.
+    """
+
+    def get_user(self, validated_token):
+        if validated_token.get('scope') == SERVICE_SCOPE:
+            return service_user(validated_token)
+        if not settings.JWT_TRUST_CLAIMS:
+            return super().get_user(validated_token)
+        if not user_cache.is_user_active(user_id_claim(validated_token)):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return TokenUser(validated_token)
+
+    async def aget_user(self, validated_token):
+        if validated_token.get('scope') == SERVICE_SCOPE:
+            return service_user(validated_token)
+        if not settings.JWT_TRUST_CLAIMS:
+            return await sync_to_async(super().get_user)(validated_token)
+        if not await user_cache.ais_user_active(user_id_claim(validated_token)):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return TokenUser(validated_token)
+
+
+class IsStaffUser(permissions.BasePermission):
+    """``IsAdminUser`` that checks staff status against the database for claims-only users.
+
+    Costs one query per request, so it is meant for rarely called admin views;
+    a demoted admin loses access immediately rather than when the token expires.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if isinstance(user, TokenUser):
+            return get_user_model().objects.filter(pk=user.id, is_active=True, is_staff=True).exists()
+        return bool(user and user.is_staff)
+
+
+class IsServiceOrStaff(IsStaffUser):
+    """Pipeline services (service-scoped tokens) and staff; for endpoints that expose other users' data."""
+
+    def has_permission(self, request, view):
+        return isinstance(request.user, ServiceUser) or super().has_permission(request, view)
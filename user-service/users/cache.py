@@ -0,0 +1,161 @@
+"""Read-through cache for notification preferences and active push tokens.
+
+Entries live in the Django cache (Redis in production) under a per-user
+version number, with a short-lived in-process tier in front. Any write to a
+user's preferences or tokens bumps the version, which both invalidates the
+cached payloads and changes the ETag callers revalidate against.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User
+from .tracing import tracer
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _local_get(key):
+    entry = _local.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        _local.pop(key, None)
+        return None
+    return value
+
+
+def _local_set(key, value):
+    with _local_lock:
+        if len(_local) >= settings.USER_CACHE_LOCAL_MAX_ENTRIES:
+            _local.clear()
+        _local[key] = (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, value)
+
+
+def clear_local():
+    with _local_lock:
+        _local.clear()
+
+
+def version_key(user_id):
+    return f'users:{user_id}:version'
+
+
+def current_version(user_id):
+    key = version_key(user_id)
+    version = _local_get(key)
+    if version is not None:
+        return version
+    version = cache.get(key)
+    if version is None:
+        # seeded from the clock so a version lost to eviction never repeats an old ETag
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    _local_set(key, version)
+    return version
+
+
+def get_or_load(user_id, kind, loader):
+    """Return ``(version, payload)`` for ``kind``, calling ``loader()`` on a miss."""
+    version = current_version(user_id)
+    key = f'users:{user_id}:{kind}:{version}'
+    payload = _local_get(key)
+    if payload is None:
+        payload = cache.get(key)
+        if payload is None:
+            with tracer.start_as_current_span(f'{kind}.load'):
+                payload = loader()
+            cache.set(key, payload, timeout=settings.USER_CACHE_TTL)
+        _local_set(key, payload)
+    return version, payload
+
+
+async def acurrent_version(user_id):
+    key = version_key(user_id)
+    version = _local_get(key)
+    if version is not None:
+        return version
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    _local_set(key, version)
+    return version
+
+
+async def aget_or_load(user_id, kind, loader):
+    """Async twin of ``get_or_load``; ``loader`` is a coroutine function."""
+    version = await acurrent_version(user_id)
+    key = f'users:{user_id}:{kind}:{version}'
+    payload = _local_get(key)
+    if payload is None:
+        payload = await cache.aget(key)
+        if payload is None:
+            with tracer.start_as_current_span(f'{kind}.load'):
+                payload = await loader()
+            await cache.aset(key, payload, timeout=settings.USER_CACHE_TTL)
+        _local_set(key, payload)
+    return version, payload
+
+
+def invalidate_users(user_ids):
+    for user_id in set(user_ids):
+        key = version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+        with _local_lock:
+            _local.pop(key, None)
+
+
+def active_key(user_id):
+    return f'users:{user_id}:active'
+
+
+def is_user_active(user_id):
+    """Cached ``is_active`` for token authentication; unknown users count as inactive."""
+    key = active_key(user_id)
+    active = _local_get(key)
+    if active is None:
+        active = cache.get(key)
+        if active is None:
+            # stored as 1/0 so a cached "inactive" is not mistaken for a miss
+            active = int(User.objects.filter(pk=user_id, is_active=True).exists())
+            cache.set(key, active, timeout=settings.USER_AUTH_STATUS_TTL)
+        _local_set(key, active)
+    return bool(active)
+
+
+async def ais_user_active(user_id):
+    key = active_key(user_id)
+    active = _local_get(key)
+    if active is None:
+        active = await cache.aget(key)
+        if active is None:
+            active = int(await User.objects.filter(pk=user_id, is_active=True).aexists())
+            await cache.aset(key, active, timeout=settings.USER_AUTH_STATUS_TTL)
+        _local_set(key, active)
+    return bool(active)
+
+
+def forget_active_status(user_id):
+    key = active_key(user_id)
+    cache.delete(key)
+    with _local_lock:
+        _local.pop(key, None)
+
+
+def etag(kind, version):
+    return f'"{kind}-{version}"'
+
+
+def not_modified(request, tag):
+    """Whether the caller already holds ``tag`` (If-None-Match); it then gets an empty 304."""
+    return tag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]
@@ -0,0 +1,37 @@
+"""Password hashing across a process pool for bulk imports.
+
+Kept free of model imports: spawned workers import this module before Django
+is set up, and ``init_worker`` then sets it up so the configured hashers load.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+@contextmanager
+def hashing_pool(workers=None):
+    """Process pool for password hashing, or None to hash in this process."""
+    workers = settings.USER_IMPORT_HASH_WORKERS if workers is None else workers
+    if workers <= 1:
+        yield None
+        return
+    # spawn rather than fork: the caller may be a threaded web worker
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+        yield pool
+
+
+def hash_passwords(passwords, pool=None):
+    # make_password(None) gives an unusable password, as create_user does
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    # each hash takes far longer than shipping it to a worker, so small chunks balance best
+    return list(pool.map(make_password, passwords, chunksize=16))
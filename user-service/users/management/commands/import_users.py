@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import parse_rows, import_users
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import users (with preferences) from a CSV or NDJSON file; resumes from a checkpoint file left by an interrupted run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, help='rows per transaction (USER_IMPORT_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, help='password-hashing processes (USER_IMPORT_HASH_WORKERS)')
+        parser.add_argument('--checkpoint', help='progress file; defaults to <path>.checkpoint')
+        parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start from row 1')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+
+        skip = 0
+        if checkpoint and not options['restart'] and os.path.exists(checkpoint):
+            with open(checkpoint) as fh:
+                skip = json.load(fh)['processed']
+            self.stdout.write(f'resuming after row {skip}')
+
+        def progress(report, errors):
+            for error in errors:
+                self.stderr.write(f"row {error['row']} ({error['email']}): {error['error']}")
+            if checkpoint:
+                # replace atomically so a crash never leaves a torn checkpoint
+                with open(f'{checkpoint}.tmp', 'w') as fh:
+                    json.dump(report, fh)
+                os.replace(f'{checkpoint}.tmp', checkpoint)
+            self.stdout.write(
+                f"processed {report['processed']}: created {report['created']}, "
+                f"existing {report['existing']}, failed {report['failed']}"
+            )
+
+        try:
+            source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with source:
+            report = import_users(
+                parse_rows(source, fmt),
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                skip=skip,
+                progress=progress,
+            )
+        if checkpoint and os.path.exists(checkpoint):
+            # the file is fully imported; a rerun starts from row 1 again
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f"done: {report['created']} created, {report['existing']} already present, {report['failed']} failed"
+        ))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import SERVICE_SCOPE
+
+
+class Command(BaseCommand):
+    help = 'Issue a service-scoped access token for a pipeline service (authenticated without a DB lookup).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('service', help='service name; must be listed in SERVICE_TOKEN_SERVICES')
+        parser.add_argument('--lifetime-days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        service = options['service']
+        if service not in settings.SERVICE_TOKEN_SERVICES:
+            raise CommandError(f'{service} is not in SERVICE_TOKEN_SERVICES')
+
+        token = AccessToken()
+        token.set_exp(lifetime=timedelta(days=options['lifetime_days']))
+        token['scope'] = SERVICE_SCOPE
+        token['service'] = service
+        self.stdout.write(str(token))
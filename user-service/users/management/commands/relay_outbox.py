@@ -0,0 +1,66 @@
+import time
+
+import pika
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.outbox import relay_lock, run_relay
+
+
+class Command(BaseCommand):
+    help = 'Publish preference and push-token change events from the outbox to RabbitMQ.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='events per message (OUTBOX_RELAY_BATCH_SIZE)')
+        parser.add_argument('--once', action='store_true', help='drain the outbox and exit')
+
+    def connect(self):
+        connection = pika.BlockingConnection(pika.URLParameters(settings.RABBITMQ_URL))
+        channel = connection.channel()
+        channel.exchange_declare(exchange=settings.USER_EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+        # basic_publish now blocks until the broker confirms, and raises if it refuses
+        channel.confirm_delivery()
+        return connection, channel
+
+    def handle(self, *args, **options):
+        while True:
+            with relay_lock() as acquired:
+                if acquired:
+                    relayed = self.relay(options)
+                    if options['once']:
+                        self.stdout.write(f'relayed {relayed} events')
+                        return
+                    continue
+            # another relay holds the lock; stand by in case it goes away
+            time.sleep(settings.OUTBOX_RELAY_POLL_INTERVAL * 10)
+
+    def relay(self, options):
+        while True:
+            try:
+                connection, channel = self.connect()
+            except pika.exceptions.AMQPError as exc:
+                self.stderr.write(f'broker unavailable ({exc!r}); retrying')
+                time.sleep(5)
+                continue
+
+            def publish(body, message_id):
+                channel.basic_publish(
+                    exchange=settings.USER_EVENTS_EXCHANGE,
+                    routing_key='',
+                    body=body,
+                    properties=pika.BasicProperties(
+                        content_type='application/json',
+                        delivery_mode=pika.DeliveryMode.Persistent,
+                        message_id=message_id,
+                    ),
+                )
+
+            try:
+                return run_relay(publish, batch_size=options['batch_size'], once=options['once'])
+            except pika.exceptions.AMQPError as exc:
+                # unconfirmed batches stay in the outbox and are sent again after reconnecting
+                self.stderr.write(f'publish failed ({exc!r}); reconnecting')
+                time.sleep(1)
+            finally:
+                if connection.is_open:
+                    connection.close()
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_categories_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS prefs_categories_gin_idx '
+        'ON users_notificationpreferences USING gin (categories jsonb_path_ops)'
+    )
+
+
+def drop_categories_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS prefs_categories_gin_idx')
+
+
+def backfill_preference_categories(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    NotificationPreferences = apps.get_model('users', 'NotificationPreferences')
+    PreferenceCategory = apps.get_model('users', 'PreferenceCategory')
+    rows = []
+    for user_id, categories in NotificationPreferences.objects.values_list('user_id', 'categories').iterator():
+        rows.extend(
+            PreferenceCategory(user_id=user_id, category=category)
+            for category in set(categories or [])
+            if isinstance(category, str)
+        )
+    PreferenceCategory.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_pushtoken_device_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreferenceCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notificationpreferences',
+            index=models.Index(fields=['email_notifications', 'user'], name='prefs_email_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationpreferences',
+            index=models.Index(fields=['push_notifications', 'user'], name='prefs_push_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationpreferences',
+            index=models.Index(fields=['sms_notifications', 'user'], name='prefs_sms_user_idx'),
+        ),
+        migrations.AddField(
+            model_name='preferencecategory',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preference_categories', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='preferencecategory',
+            index=models.Index(fields=['category', 'user'], name='pref_category_user_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='preferencecategory',
+            unique_together={('user', 'category')},
+        ),
+        migrations.RunPython(create_categories_gin_index, drop_categories_gin_index),
+        migrations.RunPython(backfill_preference_categories, migrations.RunPython.noop),
+    ]
+
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_segment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('user_id', models.UUIDField()),
+                ('event_type', models.CharField(choices=[('preferences.changed', 'Preferences changed'), ('push_tokens.changed', 'Push tokens changed')], max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
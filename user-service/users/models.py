@@ -1,5 +1,5 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import (
     AbstractBaseUser, BaseUserManager, PermissionsMixin
 )
@@ -26,6 +26,69 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 # Create your models here.
 
+class UserScopedQuerySet(models.QuerySet):
+    """QuerySet for per-user rows that keeps derived state in step with bulk writes.
+
+    Signals cover save() and delete(); update(), bulk_create() and bulk_update()
+    bypass them, so they record outbox events (in the write's transaction),
+    resync segment categories and invalidate the read cache (once committed) here.
+    """
+
+    def _changed(self, user_ids):
+        from .cache import invalidate_users
+        user_ids = list(user_ids)
+        transaction.on_commit(lambda: invalidate_users(user_ids), using=self.db)
+        if self.model is NotificationPreferences:
+            from .segments import sync_categories
+            sync_categories(user_ids)
+
+    def _record(self, user_ids):
+        from .outbox import record_changes
+        record_changes(self.model, user_ids)
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            user_ids = list(self.values_list('user_id', flat=True).distinct())
+            rows = super().update(**kwargs)
+            self._record(user_ids)
+        self._changed(user_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            self._record(obj.user_id for obj in objs)
+        self._changed(obj.user_id for obj in objs)
+        return objs
+
+    def bulk_update(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            rows = super().bulk_update(objs, *args, **kwargs)
+            self._record(obj.user_id for obj in objs)
+        self._changed(obj.user_id for obj in objs)
+        return rows
+
+
+class UserScopedModel(models.Model):
+    """Per-user row whose saves record an outbox event in the same transaction.
+
+    Deletes are covered by a post_delete receiver, which Django already runs
+    inside the deletion's transaction (including cascades). post_save receivers
+    therefore also run before the commit; anything other readers can observe,
+    such as cache invalidation, is deferred with ``transaction.on_commit``.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from .outbox import record_changes
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+            record_changes(type(self), [self.user_id])
+
+
 class User(AbstractBaseUser, PermissionsMixin):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -42,7 +105,7 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.email
 
 
-class PushToken(models.Model):
+class PushToken(UserScopedModel):
     ANDROID = 'android'
     IOS = 'ios'
     WEB = 'web'
@@ -63,6 +126,8 @@ class PushToken(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = UserScopedQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Push Token'
         verbose_name_plural = 'Push Tokens'
@@ -72,7 +137,7 @@ class PushToken(models.Model):
         return f"{self.user.email} - {self.device_type}"
 
 
-class NotificationPreferences(models.Model):
+class NotificationPreferences(UserScopedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField('User', on_delete=models.CASCADE, related_name='preferences')
     email_notifications = models.BooleanField(default=True)
@@ -80,5 +145,57 @@ class NotificationPreferences(models.Model):
     sms_notifications = models.BooleanField(default=False)
     categories = models.JSONField(default=list, blank=True)
 
+    objects = UserScopedQuerySet.as_manager()
+
+    class Meta:
+        # segment queries walk users in id order filtered by a channel flag
+        indexes = [
+            models.Index(fields=['email_notifications', 'user'], name='prefs_email_user_idx'),
+            models.Index(fields=['push_notifications', 'user'], name='prefs_push_user_idx'),
+            models.Index(fields=['sms_notifications', 'user'], name='prefs_sms_user_idx'),
+        ]
+
     def __str__(self):
-        return f"Preferences for {self.user.email}"
\ No newline at end of file
+        return f"Preferences for {self.user.email}"
+
+
+class PreferenceCategory(models.Model):
+    """Normalized copy of ``NotificationPreferences.categories``.
+
+    Postgres answers category filters from a GIN index on the JSON column; other
+    databases cannot index into JSON, so segment queries join this table instead.
+    """
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='preference_categories')
+    category = models.CharField(max_length=100)
+
+    class Meta:
+        unique_together = ('user', 'category')
+        indexes = [models.Index(fields=['category', 'user'], name='pref_category_user_idx')]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.category}"
+
+
+class OutboxEvent(models.Model):
+    """A change to a user's preferences or push tokens, waiting to be published.
+
+    Written in the same transaction as the change; ``manage.py relay_outbox``
+    publishes pending rows in id order and deletes them once the broker confirms.
+    """
+    PREFERENCES_CHANGED = 'preferences.changed'
+    PUSH_TOKENS_CHANGED = 'push_tokens.changed'
+
+    EVENT_CHOICES = [
+        (PREFERENCES_CHANGED, 'Preferences changed'),
+        (PUSH_TOKENS_CHANGED, 'Push tokens changed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    # not a foreign key: the event for a deleted user's rows must outlive the user
+    user_id = models.UUIDField()
+    event_type = models.CharField(max_length=32, choices=EVENT_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_type} for {self.user_id}"
+
@@ -0,0 +1,106 @@
+"""Transactional outbox for preference and push-token change events.
+
+Writes record an ``OutboxEvent`` in the same transaction as the change (see
+``UserScopedModel`` and ``UserScopedQuerySet``). The relay reads pending events
+in id order and publishes each batch as one persistent message to the
+``USER_EVENTS_EXCHANGE`` fanout exchange, deleting the rows only after the
+broker confirms. Delivery is at least once; a batch that was published but not
+yet deleted when the relay stopped is sent again, with the same message_id.
+
+A single relay publishes at a time (a Postgres advisory lock elects it), so
+events for a user reach consumers in the order they were written.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from .models import OutboxEvent, PushToken, NotificationPreferences
+
+EVENT_TYPES = {
+    NotificationPreferences: OutboxEvent.PREFERENCES_CHANGED,
+    PushToken: OutboxEvent.PUSH_TOKENS_CHANGED,
+}
+
+# arbitrary, fixed key for pg_try_advisory_lock
+RELAY_LOCK_ID = 0x75736572
+
+
+def record_changes(model, user_ids):
+    """Queue one change event per user; call inside the transaction that made the change."""
+    event_type = EVENT_TYPES[model]
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(user_id=user_id, event_type=event_type) for user_id in dict.fromkeys(user_ids)
+    ])
+
+
+def event_payload(event):
+    return {
+        'id': event.id,
+        'type': event.event_type,
+        'user_id': str(event.user_id),
+        'occurred_at': event.created_at.isoformat(),
+    }
+
+
+def coalesce(events):
+    """Drop repeats of the same (user, type) within a batch, keeping the latest.
+
+    Events are invalidation signals, so only the last of a run matters, and
+    keeping the latest position preserves each user's order.
+    """
+    latest = {}
+    for event in events:
+        key = (event.user_id, event.event_type)
+        latest.pop(key, None)
+        latest[key] = event
+    return list(latest.values())
+
+
+def relay_batch(publish, batch_size=None):
+    """Publish the oldest pending events as one message; returns how many rows were relayed.
+
+    ``publish(body, message_id)`` must return only once the broker has accepted
+    the message, and raise otherwise.
+    """
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+    events = list(OutboxEvent.objects.order_by('id')[:batch_size])
+    if not events:
+        return 0
+    body = json.dumps({'events': [event_payload(event) for event in coalesce(events)]})
+    publish(body.encode(), f'{events[0].id}-{events[-1].id}')
+    OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+    return len(events)
+
+
+@contextmanager
+def relay_lock():
+    """Yield whether this process may relay; only one relay may hold the lock."""
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [RELAY_LOCK_ID])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [RELAY_LOCK_ID])
+
+
+def run_relay(publish, batch_size=None, poll_interval=None, once=False):
+    """Relay until stopped; full batches are followed immediately by the next one."""
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+    poll_interval = settings.OUTBOX_RELAY_POLL_INTERVAL if poll_interval is None else poll_interval
+    relayed = 0
+    while True:
+        sent = relay_batch(publish, batch_size)
+        relayed += sent
+        if sent < batch_size:
+            if once:
+                return relayed
+            time.sleep(poll_interval)
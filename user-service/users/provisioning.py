@@ -0,0 +1,175 @@
+"""Bulk user import for onboarding a partner's user base.
+
+Input is CSV (header row) or NDJSON with one user per row:
+
+    email, full_name, password | password_hash,
+    email_notifications, push_notifications, sms_notifications, categories
+
+``password_hash`` must already be in Django's ``<algorithm>$...`` format and is
+stored as is; plain passwords are hashed across a process pool. Rows are
+written in batches, one transaction per batch, with a preferences row per user.
+Emails that already exist are skipped, so a failed import can be rerun from
+the last reported ``processed`` count (or from the start) without duplicates.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .hashing import hashing_pool, hash_passwords
+from .models import User, NotificationPreferences
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+CHANNEL_DEFAULTS = {
+    'email_notifications': True,
+    'push_notifications': True,
+    'sms_notifications': False,
+}
+
+
+def parse_rows(lines, fmt):
+    """Yield one dict per input row; NDJSON lines that do not parse yield None."""
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def _flag(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f'expected a boolean, got {value!r}')
+
+
+def _categories(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        # CSV cells hold a |-separated list
+        value = value.split('|')
+    if not isinstance(value, list) or not all(isinstance(c, str) for c in value):
+        raise ValueError('categories must be a list of strings')
+    return [c.strip() for c in value if c.strip()]
+
+
+def clean_row(row):
+    """Validate one input row; returns ``(record, None)`` or ``(None, error)``."""
+    if row is None:
+        return None, 'row is not a JSON object'
+    email = (row.get('email') or '').strip()
+    try:
+        validate_email(email)
+    except ValidationError:
+        return None, 'invalid email'
+
+    record = {
+        'email': User.objects.normalize_email(email),
+        'full_name': (row.get('full_name') or '').strip()[:255],
+        'password': None,
+        'password_hash': None,
+    }
+    if row.get('password_hash'):
+        try:
+            identify_hasher(row['password_hash'])
+        except ValueError:
+            return None, 'password_hash is not in a recognised format'
+        record['password_hash'] = row['password_hash']
+    elif row.get('password'):
+        record['password'] = row['password']
+
+    try:
+        record['preferences'] = {
+            field: _flag(row.get(field), default) for field, default in CHANNEL_DEFAULTS.items()
+        }
+        record['preferences']['categories'] = _categories(row.get('categories'))
+    except ValueError as exc:
+        return None, str(exc)
+    return record, None
+
+
+def import_batch(rows, first_row, pool=None):
+    """Import one batch; returns ``(created, existing, errors)``.
+
+    ``errors`` is a list of ``{'row', 'email', 'error'}`` with 1-based row numbers.
+    """
+    records, errors, seen = [], [], set()
+    for row_number, row in enumerate(rows, start=first_row):
+        record, error = clean_row(row)
+        if record is not None and record['email'] in seen:
+            record, error = None, 'duplicate email in input'
+        if error:
+            errors.append({'row': row_number, 'email': (row or {}).get('email'), 'error': error})
+            continue
+        seen.add(record['email'])
+        records.append(record)
+
+    existing = set(User.objects.filter(email__in=seen).values_list('email', flat=True))
+    records = [record for record in records if record['email'] not in existing]
+
+    to_hash = [record for record in records if record['password_hash'] is None]
+    for record, hashed in zip(to_hash, hash_passwords([r['password'] for r in to_hash], pool)):
+        record['password_hash'] = hashed
+
+    users = [
+        User(email=record['email'], full_name=record['full_name'], password=record['password_hash'])
+        for record in records
+    ]
+    preferences = [
+        NotificationPreferences(user=user, **record['preferences'])
+        for user, record in zip(users, records)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        NotificationPreferences.objects.bulk_create(preferences)
+    return len(users), len(existing), errors
+
+
+def iter_import(rows, batch_size=None, workers=None, skip=0):
+    """Import ``rows`` (from ``parse_rows``) in batches, resuming after ``skip`` rows.
+
+    Yields ``(report, errors)`` after each committed batch: the running totals
+    and that batch's row errors.
+    """
+    batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+    report = {'processed': skip, 'created': 0, 'existing': 0, 'failed': 0}
+    rows = islice(rows, skip, None)
+    with hashing_pool(workers) as pool:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            created, existing, errors = import_batch(batch, report['processed'] + 1, pool)
+            report['processed'] += len(batch)
+            report['created'] += created
+            report['existing'] += existing
+            report['failed'] += len(errors)
+            yield report, errors
+
+
+def import_users(rows, batch_size=None, workers=None, skip=0, progress=None):
+    """Run ``iter_import`` to the end, calling ``progress(report, errors)`` per batch."""
+    report = {'processed': skip, 'created': 0, 'existing': 0, 'failed': 0}
+    for report, errors in iter_import(rows, batch_size, workers, skip):
+        if progress:
+            progress(report, errors)
+    return report
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import transaction
+
+from .models import User, PushToken
+
+
+def dedupe(rows):
+    """Last write wins per (user, token) and, when a device_id is given, per (user, device_id)."""
+    by_token = {}
+    for row in rows:
+        by_token[(row['user_id'], row['token'])] = row
+    by_device = {}
+    for key, row in by_token.items():
+        device_key = ('device', row['user_id'], row['device_id']) if row['device_id'] else key
+        by_device.pop(device_key, None)
+        by_device[device_key] = row
+    return list(by_device.values())
+
+
+def upsert_chunk(rows):
+    """Insert or refresh one chunk of tokens and deactivate what they supersede; returns counts."""
+    known = set(User.objects.filter(id__in={row['user_id'] for row in rows}).values_list('id', flat=True))
+    accepted = [row for row in rows if row['user_id'] in known]
+    rejected = [row for row in rows if row['user_id'] not in known]
+
+    with transaction.atomic():
+        PushToken.objects.bulk_create(
+            [
+                PushToken(
+                    user_id=row['user_id'],
+                    token=row['token'],
+                    device_type=row['device_type'],
+                    device_id=row['device_id'],
+                    is_active=True,
+                )
+                for row in accepted
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'token'],
+            update_fields=['device_type', 'device_id', 'is_active'],
+        )
+
+        # an app reinstall or upgrade issues a new token for the same device; retire the old ones
+        current = {(row['user_id'], row['device_id']): row['token'] for row in accepted if row['device_id']}
+        deactivated = 0
+        if current:
+            # flat IN lists, not an OR term per row: SQLite caps expression depth at 1000
+            candidates = PushToken.objects.filter(
+                user_id__in={user_id for user_id, _ in current},
+                device_id__in={device_id for _, device_id in current},
+                is_active=True,
+            ).values_list('id', 'user_id', 'device_id', 'token')
+            superseded = [
+                pk for pk, user_id, device_id, token in candidates
+                if current.get((user_id, device_id), token) != token
+            ]
+            if superseded:
+                deactivated = PushToken.objects.filter(id__in=superseded).update(is_active=False)
+
+    return len(accepted), deactivated, rejected
+
+
+def upsert_push_tokens(rows, chunk_size=None):
+    chunk_size = chunk_size or settings.USER_TOKEN_UPSERT_CHUNK_SIZE
+    rows = dedupe(rows)
+    upserted = deactivated = 0
+    rejected = []
+    for start in range(0, len(rows), chunk_size):
+        chunk_upserted, chunk_deactivated, chunk_rejected = upsert_chunk(rows[start:start + chunk_size])
+        upserted += chunk_upserted
+        deactivated += chunk_deactivated
+        rejected.extend(chunk_rejected)
+    return {
+        'upserted': upserted,
+        'deactivated': deactivated,
+        'rejected': [
+            {'user_id': str(row['user_id']), 'fcm_token': row['token'], 'error': 'user not found'}
+            for row in rejected
+        ],
+    }
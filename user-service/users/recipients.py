@@ -0,0 +1,110 @@
+import json
+
+from django.conf import settings
+from django.db.models import Prefetch
+
+from .models import User, PushToken, NotificationPreferences
+from .tracing import tracer
+
+
+PREFERENCE_FIELDS = ('email_notifications', 'push_notifications', 'sms_notifications', 'categories')
+
+
+def recipient_queryset():
+    # two queries per batch: users joined to preferences, then active tokens for all of them
+    return (
+        User.objects
+        .select_related('preferences')
+        .prefetch_related(Prefetch(
+            'push_tokens',
+            queryset=PushToken.objects.filter(is_active=True).order_by('-created_at'),
+            to_attr='active_push_tokens',
+        ))
+    )
+
+
+def preferences_payload(preferences):
+    if preferences is None:
+        # users without a row get the model defaults, without writing one like get_or_create would
+        return {name: NotificationPreferences._meta.get_field(name).get_default() for name in PREFERENCE_FIELDS}
+    return {name: getattr(preferences, name) for name in PREFERENCE_FIELDS}
+
+
+def push_token_payload(token):
+    return {
+        'id': str(token.id),
+        'device_id': token.device_id,
+        'fcm_token': token.token,
+        'platform': token.device_type,
+    }
+
+
+def recipient_payload(user):
+    try:
+        preferences = user.preferences
+    except NotificationPreferences.DoesNotExist:
+        preferences = None
+    return {
+        'user_id': str(user.id),
+        'email': user.email,
+        'full_name': user.full_name,
+        'preferences': preferences_payload(preferences),
+        'push_tokens': [push_token_payload(token) for token in user.active_push_tokens],
+    }
+
+
+def recipient_lines(recipients, missing):
+    """NDJSON lines for one chunk: each recipient, then a not-found line per missing id."""
+    for recipient in recipients:
+        yield json.dumps(recipient) + '\n'
+    for user_id in missing:
+        yield json.dumps({'user_id': user_id, 'error': 'not found'}) + '\n'
+
+
+def recipients_envelope(recipients, not_found, requested):
+    """Response body of a non-streamed bulk lookup, shared by the sync and async views."""
+    return {
+        "success": True,
+        "message": "Recipients resolved",
+        "data": {
+            "recipients": recipients,
+            "not_found": not_found,
+        },
+        "error": None,
+        "meta": {
+            "total": len(recipients),
+            "limit": requested,
+            "page": 1,
+            "total_pages": 1,
+            "has_next": False,
+            "has_previous": False
+        }
+    }
+
+
+def iter_recipient_chunks(user_ids, chunk_size=None):
+    """Yield (recipients, missing_ids) per chunk of ``user_ids``, preserving request order."""
+    chunk_size = chunk_size or settings.USER_BULK_LOOKUP_CHUNK_SIZE
+    ordered = list(dict.fromkeys(user_ids))
+    for start in range(0, len(ordered), chunk_size):
+        chunk = ordered[start:start + chunk_size]
+        with tracer.start_as_current_span('recipients.load_chunk') as span:
+            span.set_attribute('recipients.chunk_size', len(chunk))
+            users = {user.id: user for user in recipient_queryset().filter(id__in=chunk)}
+        recipients = [recipient_payload(users[user_id]) for user_id in chunk if user_id in users]
+        missing = [str(user_id) for user_id in chunk if user_id not in users]
+        yield recipients, missing
+
+
+async def aiter_recipient_chunks(user_ids, chunk_size=None):
+    """Async twin of ``iter_recipient_chunks`` for the ASGI views."""
+    chunk_size = chunk_size or settings.USER_BULK_LOOKUP_CHUNK_SIZE
+    ordered = list(dict.fromkeys(user_ids))
+    for start in range(0, len(ordered), chunk_size):
+        chunk = ordered[start:start + chunk_size]
+        with tracer.start_as_current_span('recipients.load_chunk') as span:
+            span.set_attribute('recipients.chunk_size', len(chunk))
+            users = {user.id: user async for user in recipient_queryset().filter(id__in=chunk)}
+        recipients = [recipient_payload(users[user_id]) for user_id in chunk if user_id in users]
+        missing = [str(user_id) for user_id in chunk if user_id not in users]
+        yield recipients, missing
@@ -0,0 +1,75 @@
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import User, NotificationPreferences, PreferenceCategory
+
+CHANNELS = ('email', 'push', 'sms')
+
+
+def uses_json_containment():
+    # only Postgres has the GIN index on categories; everything else uses PreferenceCategory
+    return connection.vendor == 'postgresql'
+
+
+def sync_categories(user_ids):
+    """Rewrite the PreferenceCategory rows for ``user_ids`` from their preferences."""
+    if uses_json_containment():
+        return
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return
+    rows = NotificationPreferences.objects.filter(user_id__in=user_ids).values_list('user_id', 'categories')
+    with transaction.atomic():
+        PreferenceCategory.objects.filter(user_id__in=user_ids).delete()
+        PreferenceCategory.objects.bulk_create([
+            PreferenceCategory(user_id=user_id, category=category)
+            for user_id, categories in rows
+            for category in set(categories or [])
+            if isinstance(category, str)
+        ])
+
+
+def segment_queryset(categories=None, channels=None):
+    """Active users matching any of ``categories`` and every ``{channel: enabled}`` flag, in id order."""
+    queryset = User.objects.filter(is_active=True)
+
+    for channel, enabled in (channels or {}).items():
+        field = f'{channel}_notifications'
+        condition = Q(**{f'preferences__{field}': enabled})
+        if NotificationPreferences._meta.get_field(field).default == enabled:
+            # users without a preferences row behave as if they had the defaults
+            condition |= Q(preferences__isnull=True)
+        queryset = queryset.filter(condition)
+
+    if categories:
+        if uses_json_containment():
+            condition = Q()
+            for category in categories:
+                condition |= Q(preferences__categories__contains=[category])
+            queryset = queryset.filter(condition)
+        else:
+            queryset = queryset.filter(Exists(
+                PreferenceCategory.objects.filter(user=OuterRef('pk'), category__in=categories)
+            ))
+
+    return queryset.order_by('id')
+
+
+def segment_page(queryset, cursor=None, limit=1000):
+    """One keyset page: rows after ``cursor`` plus the cursor for the next page (None when done)."""
+    if cursor is not None:
+        queryset = queryset.filter(id__gt=cursor)
+    rows = list(queryset.values('id', 'email')[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    recipients = [{'user_id': str(row['id']), 'email': row['email']} for row in rows]
+    next_cursor = str(rows[-1]['id']) if has_next else None
+    return recipients, next_cursor
+
+
+def iter_segment(queryset, cursor=None, page_size=1000):
+    while True:
+        recipients, cursor = segment_page(queryset, cursor, page_size)
+        yield from recipients
+        if cursor is None:
+            return
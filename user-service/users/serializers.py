@@ -1,5 +1,7 @@
 from .models import User, PushToken, NotificationPreferences
 from rest_framework import serializers
+from django.conf import settings
+import uuid
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -31,4 +33,65 @@ class PushTokenSerializer(serializers.ModelSerializer):
 class NotificationPreferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = NotificationPreferences
-        fields = ['email_notifications', 'push_notifications', 'sms_notifications', 'categories']
\ No newline at end of file
+        fields = ['email_notifications', 'push_notifications', 'sms_notifications', 'categories']
+
+
+class BulkRecipientLookupSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.USER_BULK_LOOKUP_MAX_IDS,
+    )
+
+
+class SegmentQuerySerializer(serializers.Serializer):
+    category = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    email = serializers.BooleanField(required=False, allow_null=True, default=None)
+    push = serializers.BooleanField(required=False, allow_null=True, default=None)
+    sms = serializers.BooleanField(required=False, allow_null=True, default=None)
+    cursor = serializers.UUIDField(required=False)
+    limit = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=settings.USER_SEGMENT_MAX_PAGE_SIZE,
+        default=settings.USER_SEGMENT_PAGE_SIZE,
+    )
+
+
+class BulkPushTokenUpsertSerializer(serializers.Serializer):
+    """Validates ``tokens: [{user_id, fcm_token, platform, device_id?}]``.
+
+    Rows are checked with plain loops rather than a nested serializer per row,
+    which keeps validation of tens of thousands of rows cheap.
+    """
+    tokens = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.USER_TOKEN_UPSERT_MAX_ROWS,
+    )
+
+    def validate_tokens(self, tokens):
+        platforms = {choice for choice, _ in PushToken.DEVICE_CHOICES}
+        token_length = PushToken._meta.get_field('token').max_length
+        device_id_length = PushToken._meta.get_field('device_id').max_length
+        rows, errors = [], {}
+        for index, item in enumerate(tokens):
+            try:
+                user_id = uuid.UUID(str(item['user_id']))
+                token = item['fcm_token']
+                platform = item['platform']
+                device_id = item.get('device_id') or None
+            except (KeyError, ValueError):
+                errors[index] = 'user_id, fcm_token and platform are required; user_id must be a UUID'
+                continue
+            if not isinstance(token, str) or not token or len(token) > token_length:
+                errors[index] = f'fcm_token must be a non-empty string of at most {token_length} characters'
+            elif platform not in platforms:
+                errors[index] = f'platform must be one of {sorted(platforms)}'
+            elif device_id is not None and (not isinstance(device_id, str) or len(device_id) > device_id_length):
+                errors[index] = f'device_id must be a string of at most {device_id_length} characters'
+            else:
+                rows.append({'user_id': user_id, 'token': token, 'device_type': platform, 'device_id': device_id})
+        if errors:
+            raise serializers.ValidationError(errors)
+        return rows
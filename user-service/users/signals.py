@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_users, forget_active_status
+from .outbox import record_changes
+from .segments import sync_categories
+from .models import User, PushToken, NotificationPreferences
+
+
+@receiver([post_save, post_delete], sender=NotificationPreferences)
+@receiver([post_save, post_delete], sender=PushToken)
+def invalidate_user_cache(sender, instance, using, **kwargs):
+    # after commit: invalidating earlier lets a concurrent read cache the old rows again
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_users([user_id]), using=using)
+
+
+@receiver(post_delete, sender=NotificationPreferences)
+@receiver(post_delete, sender=PushToken)
+def record_deletion(sender, instance, **kwargs):
+    # post_delete runs inside the deletion's transaction; saves record theirs in UserScopedModel.save
+    record_changes(sender, [instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=NotificationPreferences)
+def sync_preference_categories(sender, instance, **kwargs):
+    sync_categories([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_status(sender, instance, using, **kwargs):
+    # token authentication caches is_active; deactivation must take effect on the next request
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_active_status(user_id), using=using)
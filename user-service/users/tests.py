@@ -1,3 +1,707 @@
-from django.test import TestCase
+import json
+import uuid
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import User, PushToken, NotificationPreferences, PreferenceCategory, OutboxEvent
+from . import async_views, cache as user_cache
+from .authentication import ServiceUser
+
+
+def make_user(index, with_preferences=True, tokens=2):
+    user = User.objects.create(email=f'user{index}@example.com', full_name=f'User {index}')
+    if with_preferences:
+        NotificationPreferences.objects.create(user=user, push_notifications=index % 2 == 0, categories=['news'])
+    for n in range(tokens):
+        PushToken.objects.create(user=user, token=f'token-{index}-{n}', device_type=PushToken.ANDROID)
+    PushToken.objects.create(user=user, token=f'stale-{index}', is_active=False)
+    return user
+
+
+def service_caller(service='push-service'):
+    token = AccessToken()
+    token['scope'] = 'service'
+    token['service'] = service
+    return ServiceUser(token)
+
+
+class BulkRecipientLookupTests(TestCase):
+    url = reverse('user-bulk-recipients')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(service_caller())
+
+    def test_resolves_preferences_and_active_tokens(self):
+        user = make_user(0)
+        bare = make_user(1, with_preferences=False, tokens=0)
+        unknown = uuid.uuid4()
+
+        response = self.client.post(self.url, {'user_ids': [str(user.id), str(bare.id), str(unknown)]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        first, second = data['recipients']
+        self.assertEqual(first['email'], user.email)
+        self.assertEqual(first['preferences']['categories'], ['news'])
+        self.assertEqual(sorted(t['fcm_token'] for t in first['push_tokens']), ['token-0-0', 'token-0-1'])
+        self.assertEqual(second['preferences']['push_notifications'], True)
+        self.assertEqual(second['push_tokens'], [])
+        self.assertEqual(data['not_found'], [str(unknown)])
+        self.assertFalse(NotificationPreferences.objects.filter(user=bare).exists())
+
+    def test_query_count_does_not_grow_with_users(self):
+        few = [str(make_user(i).id) for i in range(3)]
+        many = few + [str(make_user(i).id) for i in range(3, 40)]
+
+        # one query for the users with their preferences, one for their active tokens
+        with self.assertNumQueries(2):
+            self.client.post(self.url, {'user_ids': few}, format='json')
+        with self.assertNumQueries(2):
+            self.client.post(self.url, {'user_ids': many}, format='json')
+
+    @override_settings(USER_BULK_LOOKUP_CHUNK_SIZE=10)
+    def test_chunks_cost_a_fixed_number_of_queries(self):
+        ids = [str(make_user(i).id) for i in range(25)]
+
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, {'user_ids': ids}, format='json')
+        self.assertEqual([r['user_id'] for r in response.json()['data']['recipients']], ids)
+
+    def test_streams_ndjson(self):
+        ids = [str(make_user(i).id) for i in range(3)]
+        unknown = str(uuid.uuid4())
+
+        response = self.client.post(f'{self.url}?stream=true', {'user_ids': ids + [unknown]}, format='json')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['user_id'] for line in lines], ids + [unknown])
+        self.assertEqual(lines[-1]['error'], 'not found')
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.post(self.url, {'user_ids': [str(uuid.uuid4())]}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_plain_users_are_forbidden(self):
+        self.client.force_authenticate(User.objects.create(email='caller@example.com'))
+        response = self.client.post(self.url, {'user_ids': [str(uuid.uuid4())]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class CachedReadPathTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        self.client = APIClient()
+        self.user = make_user(0)
+        self.client.force_authenticate(self.user)
+        self.preferences_url = reverse('user-preferences', args=[self.user.id])
+        self.tokens_url = reverse('user-push-tokens', args=[self.user.id])
+
+    def test_second_read_skips_the_database(self):
+        first = self.client.get(self.preferences_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.preferences_url)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_read_does_not_create_preferences(self):
+        bare = make_user(1, with_preferences=False, tokens=0)
+        response = self.client.get(reverse('user-preferences', args=[bare.id]))
+        self.assertEqual(response.json()['push_notifications'], True)
+        self.assertFalse(NotificationPreferences.objects.filter(user=bare).exists())
+
+    def test_unknown_user_is_not_found(self):
+        response = self.client.get(reverse('user-preferences', args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_if_none_match_returns_not_modified(self):
+        tag = self.client.get(self.preferences_url)['ETag']
+        response = self.client.get(self.preferences_url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_update_invalidates_and_changes_etag(self):
+        before = self.client.get(self.preferences_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = self.client.patch(self.preferences_url, {'sms_notifications': True}, format='json')
+        after = self.client.get(self.preferences_url)
+        self.assertNotEqual(before['ETag'], updated['ETag'])
+        self.assertEqual(updated['ETag'], after['ETag'])
+        self.assertTrue(after.json()['sms_notifications'])
+
+    def test_token_save_invalidates_token_list(self):
+        self.assertEqual(len(self.client.get(self.tokens_url).json()), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            PushToken.objects.create(user=self.user, token='fresh', device_type=PushToken.IOS)
+        self.assertEqual(len(self.client.get(self.tokens_url).json()), 3)
+
+    def test_bulk_update_invalidates(self):
+        self.assertEqual(len(self.client.get(self.tokens_url).json()), 2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            PushToken.objects.filter(user=self.user).update(is_active=False)
+        # still cached until the update commits
+        self.assertEqual(len(self.client.get(self.tokens_url).json()), 2)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(self.tokens_url).json(), [])
+
+
+class SegmentQueryTests(TestCase):
+    url = reverse('user-segments')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.users = [make_user(i, tokens=0) for i in range(6)]
+        self.client.force_authenticate(service_caller())
+        # even indexes have push enabled; everyone starts on ['news']
+        NotificationPreferences.objects.filter(user__in=self.users[:3]).update(categories=['news', 'promo'])
+        self.bare = make_user(99, with_preferences=False, tokens=0)
+
+    def ids(self, users):
+        return sorted(str(user.id) for user in users)
+
+    def test_filters_on_category_and_channel(self):
+        response = self.client.get(self.url, {'category': 'promo', 'push': 'true'})
+        self.assertEqual([r['user_id'] for r in response.json()['data']], self.ids([self.users[0], self.users[2]]))
+
+    def test_users_without_preferences_follow_defaults(self):
+        response = self.client.get(self.url, {'push': 'true'})
+        expected = self.ids([u for i, u in enumerate(self.users) if i % 2 == 0] + [self.bare])
+        self.assertEqual([r['user_id'] for r in response.json()['data']], expected)
+
+    def test_categories_follow_preference_changes(self):
+        preferences = self.users[5].preferences
+        preferences.categories = ['promo']
+        preferences.save()
+        response = self.client.get(self.url, {'category': 'promo'})
+        self.assertIn(str(self.users[5].id), [r['user_id'] for r in response.json()['data']])
+        self.assertEqual(PreferenceCategory.objects.filter(user=self.users[5]).count(), 1)
+
+    def test_keyset_pages_cover_segment_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'category': 'news', 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            with self.assertNumQueries(1):
+                body = self.client.get(self.url, params).json()
+            seen.extend(r['user_id'] for r in body['data'])
+            cursor = body['meta']['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, self.ids(self.users))
+
+    def test_streams_every_page(self):
+        response = self.client.get(self.url, {'category': 'news', 'limit': 2, 'stream': 'true'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['user_id'] for line in lines], self.ids(self.users))
+
+    def test_plain_users_are_forbidden(self):
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get(self.url, {'category': 'news'}).status_code, 403)
+
+    def test_staff_users_are_allowed(self):
+        self.client.force_authenticate(User.objects.create(email='staff@example.com', is_staff=True))
+        self.assertEqual(self.client.get(self.url, {'category': 'news'}).status_code, 200)
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        self.factory = AsyncRequestFactory()
+        self.user = make_user(0)
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    async def test_preferences_match_sync_view(self):
+        expected = await sync_to_async(self.client.get)(reverse('user-preferences', args=[self.user.id]))
+        request = self.factory.get('/', headers=self.auth)
+        response = await async_views.preferences(request, user_id=self.user.id)
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+    async def test_push_tokens_revalidate_with_etag(self):
+        first = await async_views.push_tokens(self.factory.get('/', headers=self.auth), user_id=self.user.id)
+        self.assertEqual(len(json.loads(first.content)), 2)
+        again = await async_views.push_tokens(
+            self.factory.get('/', headers={'If-None-Match': first['ETag'], **self.auth}), user_id=self.user.id)
+        self.assertEqual(again.status_code, 304)
+
+    async def test_requires_token(self):
+        response = await async_views.preferences(self.factory.get('/'), user_id=self.user.id)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_unknown_user(self):
+        response = await async_views.preferences(self.factory.get('/', headers=self.auth), user_id=uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+
+    async def test_bulk_recipients(self):
+        auth = {'Authorization': f'Bearer {service_caller().token}'}
+        request = self.factory.post('/', {'user_ids': [str(self.user.id)]}, content_type='application/json', headers=auth)
+        response = await async_views.bulk_recipients(request)
+        recipients = json.loads(response.content)['data']['recipients']
+        self.assertEqual(recipients[0]['email'], self.user.email)
+        self.assertEqual(len(recipients[0]['push_tokens']), 2)
+
+    async def test_bulk_recipients_match_sync_view(self):
+        body = {'user_ids': [str(self.user.id), str(uuid.uuid4())]}
+        auth = {'Authorization': f'Bearer {service_caller().token}'}
+
+        def sync_content(query):
+            self.client.force_authenticate(service_caller())
+            response = self.client.post(reverse('user-bulk-recipients') + query, body, format='json')
+            return b''.join(response.streaming_content) if response.streaming else response.content
+
+        for query in ('', '?stream=true'):
+            expected = await sync_to_async(sync_content)(query)
+            response = await async_views.bulk_recipients(
+                self.factory.post('/' + query, body, content_type='application/json', headers=auth))
+            if response.streaming:
+                self.assertEqual(b''.join([line async for line in response.streaming_content]), expected)
+            else:
+                self.assertEqual(json.loads(response.content), json.loads(expected))
+
+    async def test_bulk_recipients_forbids_plain_users(self):
+        request = self.factory.post('/', {'user_ids': [str(self.user.id)]}, content_type='application/json', headers=self.auth)
+        response = await async_views.bulk_recipients(request)
+        self.assertEqual(response.status_code, 403)
+
+
+class ClaimsAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        self.user = make_user(0)
+        self.url = reverse('user-preferences', args=[self.user.id])
+        self.client = APIClient()
+
+    def bearer(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def service_token(self, service='push-service'):
+        token = AccessToken()
+        token['scope'] = 'service'
+        token['service'] = service
+        return token
+
+    def test_warm_lookup_runs_no_queries(self):
+        self.bearer(AccessToken.for_user(self.user))
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_service_token_skips_user_lookup(self):
+        self.bearer(self.service_token())
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_service_is_rejected(self):
+        self.bearer(self.service_token('someone-else'))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @override_settings(SERVICE_TOKEN_NOT_BEFORE=2 ** 40)
+    def test_revoked_service_token_is_rejected(self):
+        self.bearer(self.service_token())
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deactivation_applies_immediately(self):
+        self.bearer(AccessToken.for_user(self.user))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class PushTokenBulkUpsertTests(TestCase):
+    url = reverse('push-tokens-bulk-upsert')
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        self.client = APIClient()
+        self.user = make_user(0, tokens=0)
+        self.client.force_authenticate(service_caller())
+
+    def row(self, token, platform=PushToken.ANDROID, device_id=None, user_id=None):
+        return {'user_id': str(user_id or self.user.id), 'fcm_token': token, 'platform': platform, 'device_id': device_id}
+
+    def test_inserts_and_reactivates(self):
+        response = self.client.post(self.url, {'tokens': [
+            self.row('fresh'),
+            self.row('stale-0', platform=PushToken.IOS),
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], {'upserted': 2, 'deactivated': 0, 'rejected': []})
+        stale = PushToken.objects.get(user=self.user, token='stale-0')
+        self.assertTrue(stale.is_active)
+        self.assertEqual(stale.device_type, PushToken.IOS)
+        self.assertEqual(PushToken.objects.filter(user=self.user).count(), 2)
+
+    def test_new_token_supersedes_old_one_on_same_device(self):
+        PushToken.objects.create(user=self.user, token='old', device_id='phone')
+
+        response = self.client.post(self.url, {'tokens': [self.row('new', device_id='phone')]}, format='json')
+
+        self.assertEqual(response.json()['data']['deactivated'], 1)
+        self.assertEqual(list(PushToken.objects.filter(user=self.user, is_active=True).values_list('token', flat=True)),
+                         ['new'])
+
+    def test_duplicates_in_request_keep_last_row(self):
+        response = self.client.post(self.url, {'tokens': [
+            self.row('first', device_id='phone'),
+            self.row('second', device_id='phone'),
+            self.row('second', platform=PushToken.IOS, device_id='phone'),
+        ]}, format='json')
+
+        self.assertEqual(response.json()['data']['upserted'], 1)
+        token = PushToken.objects.get(user=self.user, is_active=True)
+        self.assertEqual((token.token, token.device_type), ('second', PushToken.IOS))
+
+    def test_unknown_users_are_rejected_per_row(self):
+        unknown = uuid.uuid4()
+        response = self.client.post(self.url, {'tokens': [self.row('mine'), self.row('theirs', user_id=unknown)]},
+                                    format='json')
+
+        data = response.json()['data']
+        self.assertEqual(data['upserted'], 1)
+        self.assertEqual(data['rejected'], [{'user_id': str(unknown), 'fcm_token': 'theirs', 'error': 'user not found'}])
+
+    def test_plain_users_are_forbidden(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(self.url, {'tokens': [self.row('mine')]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PushToken.objects.filter(token='mine').exists())
+
+    def test_invalid_rows_fail_validation(self):
+        response = self.client.post(self.url, {'tokens': [self.row('ok'), self.row('bad', platform='fax')]},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.json()['tokens'])
+        self.assertFalse(PushToken.objects.filter(token='ok').exists())
+
+    @override_settings(USER_TOKEN_UPSERT_CHUNK_SIZE=2)
+    def test_query_count_grows_with_chunks_not_rows(self):
+        rows = [self.row(f't{n}') for n in range(6)]
+        # per chunk: user lookup, then the upsert and its outbox rows inside one transaction
+        # (a savepoint under TestCase)
+        with self.assertNumQueries(3 * 5):
+            self.client.post(self.url, {'tokens': rows}, format='json')
+        self.assertEqual(PushToken.objects.filter(user=self.user, is_active=True).count(), 6)
+
+    def test_full_chunk_of_device_rows(self):
+        other = make_user(1, tokens=0)
+        PushToken.objects.create(user=self.user, token='old-0', device_id='device-0')
+        PushToken.objects.create(user=other, token='kept', device_id='device-0')
+        rows = [self.row(f'new-{n}', device_id=f'device-{n}') for n in range(settings.USER_TOKEN_UPSERT_CHUNK_SIZE)]
+
+        response = self.client.post(self.url, {'tokens': rows}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['deactivated'], 1)
+        self.assertFalse(PushToken.objects.get(token='old-0').is_active)
+        self.assertTrue(PushToken.objects.get(token='kept').is_active)
+
+    def test_invalidates_cached_token_list(self):
+        tokens_url = reverse('user-push-tokens', args=[self.user.id])
+        self.assertEqual(self.client.get(tokens_url).json(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'tokens': [self.row('fresh')]}, format='json')
+
+        self.assertEqual([t['fcm_token'] for t in self.client.get(tokens_url).json()], ['fresh'])
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    USER_IMPORT_HASH_WORKERS=1,
+)
+class UserImportTests(TestCase):
+    url = reverse('user-import')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create(email='admin@example.com', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def ndjson(self, *rows):
+        return ''.join(json.dumps(row) + '\n' for row in rows)
+
+    def test_imports_csv_with_preferences(self):
+        body = (
+            'email,full_name,password,push_notifications,categories\n'
+            'a@Example.com,Ann,secret,false,news|offers\n'
+            'b@example.com,Bob,,,\n'
+        )
+        response = self.client.generic('POST', self.url, body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['created'], 2)
+        ann = User.objects.get(email='a@example.com')
+        self.assertTrue(ann.check_password('secret'))
+        self.assertFalse(ann.preferences.push_notifications)
+        self.assertEqual(ann.preferences.categories, ['news', 'offers'])
+        self.assertEqual(set(PreferenceCategory.objects.filter(user=ann).values_list('category', flat=True)),
+                         {'news', 'offers'})
+        bob = User.objects.get(email='b@example.com')
+        self.assertFalse(bob.has_usable_password())
+        self.assertTrue(bob.preferences.push_notifications)
+
+    def test_accepts_pre_hashed_passwords(self):
+        from django.contrib.auth.hashers import make_password
+        hashed = make_password('secret')
+        self.client.generic('POST', self.url, self.ndjson({'email': 'a@example.com', 'password_hash': hashed}),
+                            content_type='application/x-ndjson')
+        self.assertEqual(User.objects.get(email='a@example.com').password, hashed)
+
+    def test_bad_rows_are_reported_and_others_imported(self):
+        response = self.client.generic('POST', self.url, self.ndjson(
+            {'email': 'not-an-email'},
+            {'email': 'a@example.com', 'password_hash': 'plaintext'},
+            {'email': 'b@example.com', 'sms_notifications': 'maybe'},
+            {'email': 'c@example.com'},
+            {'email': 'c@example.com'},
+        ) + 'not json\n', content_type='application/x-ndjson')
+
+        data = response.json()['data']
+        self.assertEqual((data['created'], data['failed']), (1, 5))
+        self.assertEqual([error['row'] for error in data['errors']], [1, 2, 3, 5, 6])
+
+    def test_rerun_skips_existing_users(self):
+        body = self.ndjson(*({'email': f'u{n}@example.com'} for n in range(5)))
+        self.client.generic('POST', self.url, body, content_type='application/x-ndjson')
+        response = self.client.generic('POST', self.url, body, content_type='application/x-ndjson')
+
+        data = response.json()['data']
+        self.assertEqual((data['created'], data['existing']), (0, 5))
+        self.assertEqual(User.objects.filter(email__startswith='u').count(), 5)
+
+    @override_settings(USER_IMPORT_BATCH_SIZE=2)
+    def test_streams_progress_and_resumes_from_offset(self):
+        body = self.ndjson(*({'email': f'u{n}@example.com'} for n in range(5)))
+        response = self.client.generic('POST', f'{self.url}?stream=true&offset=1', body,
+                                       content_type='application/x-ndjson')
+
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['progress']['processed'] for line in lines], [3, 5])
+        self.assertFalse(User.objects.filter(email='u0@example.com').exists())
+        self.assertEqual(User.objects.filter(email__startswith='u').count(), 4)
+
+    @override_settings(USER_IMPORT_BATCH_SIZE=50)
+    def test_batch_query_count_does_not_grow_with_rows(self):
+        body = self.ndjson(*({'email': f'u{n}@example.com', 'categories': ['news']} for n in range(50)))
+        # existing-email check, then users, preferences, outbox rows and category rows in one transaction
+        with self.assertNumQueries(11):
+            self.client.generic('POST', self.url, body, content_type='application/x-ndjson')
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(User.objects.create(email='plain@example.com'))
+        response = self.client.generic('POST', self.url, self.ndjson({'email': 'a@example.com'}),
+                                       content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 403)
+
+    def login(self, email, password='secret'):
+        client = APIClient()
+        response = client.post(reverse('token_obtain_pair'), {'email': email, 'password': password}, format='json')
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        return client
+
+    def test_admin_with_real_access_token_can_import(self):
+        self.admin.set_password('secret')
+        self.admin.save()
+        response = self.login('admin@example.com').generic(
+            'POST', self.url, self.ndjson({'email': 'a@example.com'}), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['created'], 1)
+
+    def test_real_access_token_rejected_once_demoted(self):
+        self.admin.set_password('secret')
+        self.admin.save()
+        client = self.login('admin@example.com')
+        User.objects.filter(pk=self.admin.pk).update(is_staff=False)
+        response = client.generic('POST', self.url, self.ndjson({'email': 'a@example.com'}),
+                                  content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 403)
+
+    def test_management_command_resumes_from_checkpoint(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'users.ndjson')
+            with open(path, 'w') as fh:
+                fh.write(self.ndjson(*({'email': f'u{n}@example.com'} for n in range(3))))
+            with open(f'{path}.checkpoint', 'w') as fh:
+                json.dump({'processed': 2}, fh)
+
+            call_command('import_users', path, stdout=StringIO())
+
+            # a finished import drops its checkpoint so a rerun does not skip rows
+            self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+        self.assertEqual(list(User.objects.filter(email__startswith='u').values_list('email', flat=True)),
+                         ['u2@example.com'])
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+    def test_process_pool_hashes_verify(self):
+        from django.contrib.auth.hashers import check_password
+        from .provisioning import hashing_pool, hash_passwords
+
+        with hashing_pool(workers=2) as pool:
+            hashed = hash_passwords(['one', 'two'], pool)
+        self.assertTrue(check_password('one', hashed[0]))
+        self.assertTrue(check_password('two', hashed[1]))
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(0, tokens=1)
+        OutboxEvent.objects.all().delete()
+
+    def events(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('user_id', 'event_type'))
+
+    def test_writes_record_events(self):
+        preferences = self.user.preferences
+        preferences.sms_notifications = True
+        preferences.save()
+        PushToken.objects.filter(user=self.user).update(is_active=False)
+        PushToken.objects.filter(user=self.user).delete()
+
+        self.assertEqual(self.events(), [
+            (self.user.id, OutboxEvent.PREFERENCES_CHANGED),
+            (self.user.id, OutboxEvent.PUSH_TOKENS_CHANGED),
+            (self.user.id, OutboxEvent.PUSH_TOKENS_CHANGED),
+            (self.user.id, OutboxEvent.PUSH_TOKENS_CHANGED),
+        ])
+
+    def test_event_rolls_back_with_the_change(self):
+        from django.db import transaction
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            PushToken.objects.create(user=self.user, token='new')
+            raise RuntimeError
+        self.assertEqual(self.events(), [])
+
+    def test_save_invalidates_cache_after_commit(self):
+        cache.clear()
+        user_cache.clear_local()
+        version = user_cache.current_version(self.user.id)
+        preferences = self.user.preferences
+        preferences.sms_notifications = True
+        with self.captureOnCommitCallbacks() as callbacks:
+            preferences.save()
+            # post_save ran inside save()'s transaction: the event is written, the cache untouched
+            self.assertEqual(self.events(), [(self.user.id, OutboxEvent.PREFERENCES_CHANGED)])
+            self.assertEqual(user_cache.current_version(self.user.id), version)
+        self.assertEqual(user_cache.current_version(self.user.id), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(user_cache.current_version(self.user.id), version)
+
+    def test_relay_publishes_batches_in_order_and_deletes_them(self):
+        from .outbox import relay_batch, run_relay
+        other = make_user(1, tokens=0)
+        OutboxEvent.objects.all().delete()
+        PushToken.objects.create(user=self.user, token='a')
+        PushToken.objects.create(user=other, token='b')
+        PushToken.objects.create(user=self.user, token='c')
+        NotificationPreferences.objects.filter(user=self.user).update(sms_notifications=True)
+
+        published = []
+        relayed = run_relay(lambda body, message_id: published.append((json.loads(body), message_id)),
+                            batch_size=3, once=True)
+
+        self.assertEqual(relayed, 4)
+        self.assertFalse(OutboxEvent.objects.exists())
+        first, second = [body['events'] for body, _ in published]
+        # repeats of (user, type) within a batch collapse to the latest
+        self.assertEqual([(e['user_id'], e['type']) for e in first], [
+            (str(other.id), OutboxEvent.PUSH_TOKENS_CHANGED),
+            (str(self.user.id), OutboxEvent.PUSH_TOKENS_CHANGED),
+        ])
+        self.assertEqual([(e['user_id'], e['type']) for e in second],
+                         [(str(self.user.id), OutboxEvent.PREFERENCES_CHANGED)])
+        self.assertLess(first[-1]['id'], second[0]['id'])
+        self.assertEqual(relay_batch(lambda *args: None), 0)
+
+    def test_failed_publish_keeps_events(self):
+        from .outbox import relay_batch
+        PushToken.objects.create(user=self.user, token='a')
+
+        def refuse(body, message_id):
+            raise ConnectionError
+        with self.assertRaises(ConnectionError):
+            relay_batch(refuse)
+        self.assertEqual(len(self.events()), 1)
+
+
+
+class TracingTests(TestCase):
+    sampled_parent = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+        from .tracing import make_provider
+        cls.exporter = InMemorySpanExporter()
+        # nothing is sampled unless the caller's trace was
+        cls.provider = make_provider(cls.exporter, sample_ratio=0)
+        trace.set_tracer_provider(cls.provider)
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        self.exporter.clear()
+        self.client = APIClient()
+        self.user = make_user(0)
+        self.client.force_authenticate(self.user)
+
+    def spans(self):
+        self.provider.force_flush()
+        return {span.name: span for span in self.exporter.get_finished_spans()}
+
+    def test_lookup_continues_the_callers_trace(self):
+        self.client.force_authenticate(service_caller())
+        self.client.post(reverse('user-bulk-recipients'), {'user_ids': [str(self.user.id)]}, format='json',
+                         HTTP_TRACEPARENT=self.sampled_parent)
+
+        spans = self.spans()
+        server = spans['POST api/users/bulk/recipients/']
+        self.assertEqual(format(server.context.trace_id, '032x'), '0af7651916cd43dd8448eb211c80319c')
+        self.assertEqual(format(server.parent.span_id, '016x'), 'b7ad6b7169203331')
+        self.assertEqual(server.attributes['http.response.status_code'], 200)
+        self.assertEqual(spans['recipients.load_chunk'].parent.span_id, server.context.span_id)
+
+    def test_cache_miss_records_the_database_load(self):
+        url = reverse('user-preferences', args=[self.user.id])
+        self.client.get(url, HTTP_TRACEPARENT=self.sampled_parent)
+        self.assertIn('preferences.load', self.spans())
+
+        self.exporter.clear()
+        self.client.get(url, HTTP_TRACEPARENT=self.sampled_parent)
+        self.assertNotIn('preferences.load', self.spans())
+
+    def test_unsampled_requests_record_nothing(self):
+        self.client.get(reverse('user-preferences', args=[self.user.id]))
+        self.assertEqual(self.spans(), {})
@@ -0,0 +1,85 @@
+"""OpenTelemetry tracing for user lookups.
+
+``TracingMiddleware`` opens a server span per request, continuing the caller's
+trace from W3C ``traceparent``/``tracestate`` headers; lookups add child spans
+for database loads. Sampling is parent-based: requests inside a sampled trace
+are always recorded, new traces are kept at TRACE_SAMPLE_RATIO. With
+TRACE_EXPORTER=none (the default) no provider is installed and spans are no-ops.
+"""
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+tracer = trace.get_tracer('user-service')
+
+
+def make_exporter():
+    if settings.TRACE_EXPORTER == 'file':
+        out = open(settings.TRACE_FILE, 'a', buffering=1)
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep)
+    if settings.TRACE_EXPORTER == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=settings.TRACE_OTLP_ENDPOINT)
+    return None
+
+
+def make_provider(exporter, sample_ratio):
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': 'user-service'}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    return provider
+
+
+def setup_tracing():
+    exporter = make_exporter()
+    if exporter is not None:
+        trace.set_tracer_provider(make_provider(exporter, settings.TRACE_SAMPLE_RATIO))
+
+
+class TracingMiddleware:
+    """One SERVER span per request, named after the matched route."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.start_span(request) as span:
+            response = self.get_response(request)
+            self.finish(span, request, response)
+        return response
+
+    async def __acall__(self, request):
+        with self.start_span(request) as span:
+            response = await self.get_response(request)
+            self.finish(span, request, response)
+        return response
+
+    def start_span(self, request):
+        return tracer.start_as_current_span(request.method, context=extract(request.headers), kind=SpanKind.SERVER)
+
+    def finish(self, span, request, response):
+        match = request.resolver_match
+        if match is not None:
+            span.update_name(f'{request.method} {match.route}')
+            span.set_attribute('http.route', match.route)
+        span.set_attribute('http.request.method', request.method)
+        span.set_attribute('http.response.status_code', response.status_code)
+        if response.status_code >= 500:
+            span.set_status(Status(StatusCode.ERROR))
@@ -1,18 +1,41 @@
+from django.conf import settings
 from django.urls import path
 from .views import (UserCreateView,
                     UserRetrieveView,
                     PreferencesRetrieveUpdateView,
                     PushTokenCreateView,
+                    BulkRecipientLookupView,
+                    SegmentQueryView,
+                    PushTokenBulkUpsertView,
+                    UserImportView,
                     )
 from .auth_views import MyTokenObtainPairView
 from rest_framework_simplejwt.views import TokenRefreshView
 
 
+if settings.USER_ASYNC_VIEWS:
+    # ASGI profile: same URLs, async handlers for the hot read paths
+    from . import async_views
+    user_retrieve = async_views.user_retrieve
+    user_preferences = async_views.preferences
+    user_push_tokens = async_views.push_tokens
+    bulk_recipients = async_views.bulk_recipients
+else:
+    user_retrieve = UserRetrieveView.as_view()
+    user_preferences = PreferencesRetrieveUpdateView.as_view()
+    user_push_tokens = PushTokenCreateView.as_view()
+    bulk_recipients = BulkRecipientLookupView.as_view()
+
+
 urlpatterns = [
     path('register/', UserCreateView.as_view(), name='user-register'),
     path('login/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('<uuid:pk>/', UserRetrieveView.as_view(), name='user-retrieve'),
-    path('<uuid:user_id>/preferences/', PreferencesRetrieveUpdateView.as_view(), name='user-preferences'),
-    path('<uuid:user_id>/push-tokens/', PushTokenCreateView.as_view(), name='user-push-tokens'),
+    path('bulk/recipients/', bulk_recipients, name='user-bulk-recipients'),
+    path('segments/', SegmentQueryView.as_view(), name='user-segments'),
+    path('import/', UserImportView.as_view(), name='user-import'),
+    path('push-tokens/bulk/', PushTokenBulkUpsertView.as_view(), name='push-tokens-bulk-upsert'),
+    path('<uuid:pk>/', user_retrieve, name='user-retrieve'),
+    path('<uuid:user_id>/preferences/', user_preferences, name='user-preferences'),
+    path('<uuid:user_id>/push-tokens/', user_push_tokens, name='user-push-tokens'),
 ]
\ No newline at end of file
@@ -1,12 +1,24 @@
 from django.shortcuts import render
 from .models import User, PushToken, NotificationPreferences
-from .serializers import UserSerializer, PushTokenSerializer, NotificationPreferenceSerializer
+from .serializers import (UserSerializer, PushTokenSerializer, NotificationPreferenceSerializer,
+                          BulkRecipientLookupSerializer, SegmentQuerySerializer,
+                          BulkPushTokenUpsertSerializer)
+from .push_tokens import upsert_push_tokens
+from .provisioning import parse_rows, import_users, iter_import
+from .recipients import iter_recipient_chunks, recipient_lines, recipients_envelope
+from .segments import CHANNELS, segment_queryset, segment_page, iter_segment
+from . import cache as user_cache
+from .authentication import IsServiceOrStaff, IsStaffUser
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .auth_views import MyTokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.http import StreamingHttpResponse
+import codecs
+import json
 
 class UserCreateView(generics.CreateAPIView):
 
@@ -49,22 +61,220 @@ class UserRetrieveView(generics.RetrieveAPIView):
     serializer_class = UserSerializer
 
 
+def wants_stream(request):
+    # plain HttpRequest attributes, so the async views can share this
+    if request.GET.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+
+def cached_response(request, data, tag):
+    if user_cache.not_modified(request, tag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': tag})
+    return Response(data, headers={'ETag': tag})
+
+
 class PreferencesRetrieveUpdateView(generics.RetrieveUpdateAPIView):
     serializer_class = NotificationPreferenceSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
+        # write path only; reads go through the cache and never create rows
         user_id = self.kwargs['user_id']
         user  = get_object_or_404(User, id=user_id)
         preferences, created = NotificationPreferences.objects.get_or_create(user=user)
         return preferences
 
-class PushTokenCreateView(generics.CreateAPIView):
+    def load_preferences(self):
+        user_id = self.kwargs['user_id']
+        preferences = NotificationPreferences.objects.filter(user_id=user_id).first()
+        if preferences is None:
+            get_object_or_404(User, id=user_id)
+            preferences = NotificationPreferences()
+        return dict(self.get_serializer(preferences).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        version, data = user_cache.get_or_load(self.kwargs['user_id'], 'preferences', self.load_preferences)
+        return cached_response(request, data, user_cache.etag('preferences', version))
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        user_id = self.kwargs['user_id']
+
+        def set_etag():
+            # runs after the save's invalidation, so the tag names the new version
+            response['ETag'] = user_cache.etag('preferences', user_cache.current_version(user_id))
+
+        transaction.on_commit(set_etag)
+        return response
+
+class PushTokenCreateView(generics.ListCreateAPIView):
     queryset = PushToken.objects.all()
     serializer_class = PushTokenSerializer
     permission_classes = [permissions.IsAuthenticated] 
 
+    def load_tokens(self):
+        user_id = self.kwargs['user_id']
+        tokens = list(PushToken.objects.filter(user_id=user_id, is_active=True).order_by('-created_at'))
+        if not tokens:
+            get_object_or_404(User, id=user_id)
+        return [dict(token) for token in self.get_serializer(tokens, many=True).data]
+
+    def list(self, request, *args, **kwargs):
+        version, data = user_cache.get_or_load(self.kwargs['user_id'], 'push_tokens', self.load_tokens)
+        return cached_response(request, data, user_cache.etag('push_tokens', version))
+
     def perform_create(self, serializer):
         user_id = self.kwargs['user_id']
         user = get_object_or_404(User, id=user_id)
         serializer.save(user=user)
+
+
+class BulkRecipientLookupView(generics.GenericAPIView):
+    """Resolve email, preferences and active push tokens for many users at once.
+
+    Pass ``?stream=true`` (or ``Accept: application/x-ndjson``) for an NDJSON
+    response, one recipient per line, suitable for very large lists.
+    """
+    serializer_class = BulkRecipientLookupSerializer
+    permission_classes = [IsServiceOrStaff]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+
+        if wants_stream(request):
+            return StreamingHttpResponse(self.stream(user_ids), content_type='application/x-ndjson')
+
+        recipients, not_found = [], []
+        for chunk, missing in iter_recipient_chunks(user_ids):
+            recipients.extend(chunk)
+            not_found.extend(missing)
+
+        return Response(recipients_envelope(recipients, not_found, len(user_ids)), status=status.HTTP_200_OK)
+
+    def stream(self, user_ids):
+        for chunk, missing in iter_recipient_chunks(user_ids):
+            yield from recipient_lines(chunk, missing)
+
+
+class SegmentQueryView(generics.GenericAPIView):
+    """Users subscribed to any of ``category`` with the given channel flags, in user id order.
+
+    Pages are keyset-based: pass the returned ``next_cursor`` as ``cursor`` to
+    continue. ``?stream=true`` walks every page and returns NDJSON.
+    """
+    serializer_class = SegmentQuerySerializer
+    permission_classes = [IsServiceOrStaff]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params.dict()
+        params.pop('stream', None)
+        if 'category' in request.query_params:
+            params['category'] = request.query_params.getlist('category')
+        serializer = self.get_serializer(data=params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+
+        queryset = segment_queryset(
+            categories=query.get('category'),
+            channels={channel: query[channel] for channel in CHANNELS if query.get(channel) is not None},
+        )
+
+        if wants_stream(request):
+            lines = (json.dumps(row) + '\n' for row in iter_segment(queryset, query.get('cursor'), query['limit']))
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+        recipients, next_cursor = segment_page(queryset, query.get('cursor'), query['limit'])
+        return Response({
+            "success": True,
+            "message": "Segment resolved",
+            "data": recipients,
+            "error": None,
+            "meta": {
+                "limit": query['limit'],
+                "has_next": next_cursor is not None,
+                "next_cursor": next_cursor,
+            }
+        }, status=status.HTTP_200_OK)
+
+
+class PushTokenBulkUpsertView(generics.GenericAPIView):
+    """Register or refresh many push tokens in one request.
+
+    Existing (user, token) pairs are reactivated and get the new platform and
+    device_id; other active tokens on the same device are deactivated.
+    """
+    serializer_class = BulkPushTokenUpsertSerializer
+    permission_classes = [IsServiceOrStaff]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data['tokens']
+        result = upsert_push_tokens(rows)
+
+        return Response({
+            "success": True,
+            "message": "Push tokens upserted",
+            "data": result,
+            "error": None,
+            "meta": {
+                "total": len(rows),
+                "limit": len(rows),
+                "page": 1,
+                "total_pages": 1,
+                "has_next": False,
+                "has_previous": False
+            }
+        }, status=status.HTTP_200_OK)
+
+
+class UserImportView(generics.GenericAPIView):
+    """Staff-only bulk import; the body is CSV (``Content-Type: text/csv``) or NDJSON.
+
+    The body is read as a stream, never buffered whole. ``?offset=N`` skips the
+    first N rows to resume an import; ``?stream=true`` reports progress as
+    NDJSON after every batch instead of one response at the end.
+    """
+    permission_classes = [IsStaffUser]
+    max_reported_errors = 1000
+
+    def post(self, request, *args, **kwargs):
+        try:
+            offset = max(0, int(request.query_params.get('offset', 0)))
+        except ValueError:
+            return Response({'offset': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+        rows = parse_rows(codecs.iterdecode(request.stream or [], 'utf-8'), fmt)
+
+        if wants_stream(request):
+            return StreamingHttpResponse(self.stream(rows, offset), content_type='application/x-ndjson')
+
+        reported = []
+
+        def collect(report, errors):
+            reported.extend(errors[:self.max_reported_errors - len(reported)])
+
+        report = import_users(rows, skip=offset, progress=collect)
+        return Response({
+            "success": True,
+            "message": "Users imported",
+            "data": {**report, "errors": reported},
+            "error": None,
+            "meta": {
+                "total": report['created'],
+                "limit": report['processed'],
+                "page": 1,
+                "total_pages": 1,
+                "has_next": False,
+                "has_previous": False
+            }
+        }, status=status.HTTP_200_OK)
+
+    def stream(self, rows, offset):
+        for report, errors in iter_import(rows, skip=offset):
+            for error in errors:
+                yield json.dumps(error) + '\n'
+            yield json.dumps({'progress': report}) + '\n'